@@ -1,6 +1,7 @@
 import os
 
 from visitor import Visitor
+from charclass import utf8Sequences
 
 
 '''
@@ -21,25 +22,40 @@ class ConcatNode(ASTNode):
 		self.children = children
 
 class AlternationNode(ASTNode):
-	def __init__(self, left, right):
-		self.left = left
-		self.right = right
+	def __init__(self, children):
+		self.children = children
 
 class DuplicationNode(ASTNode):
 	def __init__(self, op, child):
 		self.op = op
 		self.child = child
 
+class RepetitionNode(ASTNode):
+	def __init__(self, min, max, child):
+		self.min = min
+		# None if there's no upper bound
+		self.max = max
+		self.child = child
+
 class CharNode(ASTNode):
 	def __init__(self, char):
 		self.char = char
 
+class CharClassNode(ASTNode):
+	def __init__(self, charClass):
+		self.charClass = charClass
+
 class AnchorNode(ASTNode):
 	def __init__(self, start, end, child):
 		self.start = start
 		self.end = end
 		self.child = child
 
+class GroupNode(ASTNode):
+	def __init__(self, index, child):
+		self.index = index
+		self.child = child
+
 ''' AST Visitor -------------------------------- '''
 
 
@@ -58,12 +74,21 @@ class ASTNodeVisitor(Visitor):
 	def visit_DuplicationNode(self, node):
 		raise NotImplementedError()
 
+	def visit_RepetitionNode(self, node):
+		raise NotImplementedError()
+
 	def visit_CharNode(self, node):
 		raise NotImplementedError()
 
+	def visit_CharClassNode(self, node):
+		raise NotImplementedError()
+
 	def visit_AnchorNode(self, node):
 		raise NotImplementedError()
 
+	def visit_GroupNode(self, node):
+		raise NotImplementedError()
+
 ''' AST Dot Gen Visitor -------------------------- '''
 
 class ASTDotGen(ASTNodeVisitor):
@@ -94,10 +119,9 @@ digraph astgraph {
 
 	def visit_AlternationNode(self, node):
 		s = '\tnode{} [label="{}"]\n'.format(self.getNodeID(node) , '|')
-		s += self.visit(node.left)
-		s += '\tnode{} -> node{}\n'.format(self.getNodeID(node), self.getNodeID(node.left))
-		s += self.visit(node.right)
-		s += '\tnode{} -> node{}\n'.format(self.getNodeID(node), self.getNodeID(node.right))
+		for child in node.children:
+			s += self.visit(child)
+			s += '\tnode{} -> node{}\n'.format(self.getNodeID(node), self.getNodeID(child))
 		return s
 
 	def visit_DuplicationNode(self, node):
@@ -106,10 +130,21 @@ digraph astgraph {
 		s += '\tnode{} -> node{}\n'.format(self.getNodeID(node), self.getNodeID(node.child))
 		return s
 
+	def visit_RepetitionNode(self, node):
+		label = '{{{},{}}}'.format(node.min, '' if node.max is None else node.max)
+		s = '\tnode{} [label="{}"]\n'.format(self.getNodeID(node), label)
+		s += self.visit(node.child)
+		s += '\tnode{} -> node{}\n'.format(self.getNodeID(node), self.getNodeID(node.child))
+		return s
+
 	def visit_CharNode(self, node):
 		s = '\tnode{} [label="{}"]\n'.format(self.getNodeID(node), node.char.value)
 		return s
 
+	def visit_CharClassNode(self, node):
+		label = str(node.charClass).replace('\\', '\\\\').replace('"', '\\"')
+		return '\tnode{} [label="{}"]\n'.format(self.getNodeID(node), label)
+
 
 
 	def visit_AnchorNode(self, node):
@@ -122,6 +157,83 @@ digraph astgraph {
 		s += '\tnode{} -> node{}\n'.format(self.getNodeID(node), self.getNodeID(node.child))
 		return s
 
+	def visit_GroupNode(self, node):
+		s = '\tnode{} [label="({})"]\n'.format(self.getNodeID(node), node.index)
+		s += self.visit(node.child)
+		s += '\tnode{} -> node{}\n'.format(self.getNodeID(node), self.getNodeID(node.child))
+		return s
+
+
+''' AST Size Visitor ----------------------------- '''
+
+class ExpandedSize(ASTNodeVisitor):
+
+	'''
+	Counts the characters and classes in an AST as if each counted
+	repetition were written out in full, e.g. (ab){3} has 6. That's roughly
+	how many states (or instructions) it takes to match it.
+
+	If asBytes is set, it counts what matching the UTF-8 encoding takes
+	instead: a character costs one per byte, and a class costs one per byte
+	of each of its UTF-8 sequences, so '.' alone costs 28.
+	'''
+
+	def __init__(self, root, asBytes=False):
+		super().__init__()
+		self.root = root
+		self.asBytes = asBytes
+
+	def size(self):
+		return self.visit(self.root)
+
+	def visit_ConcatNode(self, node):
+		return sum(map(self.visit, node.children))
+
+	def visit_AlternationNode(self, node):
+		return sum(map(self.visit, node.children))
+
+	def visit_DuplicationNode(self, node):
+		return self.visit(node.child)
+
+	def visit_RepetitionNode(self, node):
+		# an unbounded repetition is min copies and then a loop. Every copy
+		# costs something, even if it matches nothing, like (){1000}
+		copies = node.max if node.max is not None else node.min + 1
+		return max(1, self.visit(node.child)) * copies
+
+	def visit_CharNode(self, node):
+		if not self.asBytes:
+			return 1
+		return len(node.char.value.encode('utf-8'))
+
+	def visit_CharClassNode(self, node):
+		if not self.asBytes:
+			return 1
+		return max(1, sum(map(len, utf8Sequences(node.charClass))))
+
+	def visit_AnchorNode(self, node):
+		return max(1, self.visit(node.child) if node.child is not None else 0)
+
+	def visit_GroupNode(self, node):
+		return max(1, self.visit(node.child))
+
+
+def matchesOnlyEmpty(node):
+	'''
+	Whether node can only ever match the empty string, like (), ^ or (^|$).
+	Repeating such a node any number of times (at least once) is the same
+	as having it once.
+	'''
+	if isinstance(node, (ConcatNode, AlternationNode)):
+		return all(map(matchesOnlyEmpty, node.children))
+	if isinstance(node, (DuplicationNode, GroupNode)):
+		return matchesOnlyEmpty(node.child)
+	if isinstance(node, AnchorNode):
+		return node.child is None or matchesOnlyEmpty(node.child)
+	if isinstance(node, RepetitionNode):
+		return node.max == 0 or matchesOnlyEmpty(node.child)
+	return False
+
 
 def writeASTDotGraph(rootLabel, ast, basename):
 		dotCode = ASTDotGen(ast).genDot(rootLabel)
@@ -0,0 +1,72 @@
+from collections import deque
+
+
+
+'''
+An Aho-Corasick automaton finds any of a set of words in a string in a single
+pass, no matter how many words there are. The words are put in a trie, and
+each node of the trie gets a failure link to the longest proper suffix of it
+that's also in the trie. Following the failure links ahead of time gives a
+full transition table, so searching is one dict lookup per character.
+
+Works on strs and bytes alike, as long as the words and the text agree.
+'''
+
+
+class AhoCorasick:
+	def __init__(self, words):
+		self._transitions = [{}]
+		self._isOutput = [False]
+		for word in words:
+			self._addWord(word)
+		self._genFailureTransitions()
+
+	def __len__(self):
+		return len(self._transitions)
+
+
+	def matches(self, text):
+		'''
+		Whether any of the words appear in text.
+		'''
+		transitions = self._transitions
+		isOutput = self._isOutput
+		state = 0
+		if isOutput[state]:
+			return True
+		for c in text:
+			state = transitions[state].get(c, 0)
+			if isOutput[state]:
+				return True
+		return False
+
+	def _addWord(self, word):
+		state = 0
+		for c in word:
+			if c not in self._transitions[state]:
+				self._transitions[state][c] = len(self._transitions)
+				self._transitions.append({})
+				self._isOutput.append(False)
+			state = self._transitions[state][c]
+		self._isOutput[state] = True
+
+	def _genFailureTransitions(self):
+		'''
+		Visits the trie breadth first, so each node's failure link has
+		already been completed by the time the node is reached.
+		'''
+		goto = [dict(transitions) for transitions in self._transitions]
+		failure = [0] * len(goto)
+		toProcess = deque()
+		for c, child in goto[0].items():
+			toProcess.append(child)
+
+		while len(toProcess) > 0:
+			cur = toProcess.popleft()
+			self._isOutput[cur] = self._isOutput[cur] or self._isOutput[failure[cur]]
+			transitions = dict(self._transitions[failure[cur]])
+			transitions.update(goto[cur])
+			self._transitions[cur] = transitions
+			for c, child in goto[cur].items():
+				failure[child] = self._transitions[failure[cur]].get(c, 0)
+				toProcess.append(child)
@@ -0,0 +1,171 @@
+from array import array
+from bisect import bisect_right
+from itertools import chain
+
+from charclass import CharClass
+
+
+
+'''
+An Alphabet splits all characters (or bytes) into equivalence classes: two
+characters are in the same class if every condition in the regex treats them
+the same way. Automata can then have one transition per class instead of one
+per character, and every character that doesn't appear in the regex at all
+shares class 0.
+
+Each condition covers a set of code points, given as intervals (a single
+character is an interval by itself, and a CharClass can have several). The code
+points are cut up at every interval's ends, and each piece gets a class based
+on which conditions cover it. Looking up a character's class is a bisect over
+the pieces.
+
+For speed, strings are translated into classes a block at a time with
+str.translate or bytes.translate, which gives a bytes object of class ids
+that can be indexed with directly. That only works when there are at most
+MAX_TRANSLATED_CLASSES classes. The translation of the first 256 code points
+is worked out ahead of time, and other characters are added the first time
+they're seen.
+'''
+
+
+MAX_TRANSLATED_CLASSES = 256
+MAX_CACHED_CHARS = 1 << 16
+TRANSLATE_BLOCK_SIZE = 4096
+
+
+def intervals(condition):
+	'''
+	The (first, last) intervals of code points (or byte values) a condition
+	covers.
+	'''
+	if isinstance(condition, CharClass):
+		return condition.intervals
+	c = condition if isinstance(condition, int) else ord(condition)
+	return [(c, c)]
+
+
+class _Translation(dict):
+
+	'''
+	A str.translate table which looks up characters it hasn't seen before in
+	the Alphabet, and remembers them.
+	'''
+
+	def __init__(self, alphabet):
+		super().__init__((c, alphabet.classOf(c)) for c in range(256))
+		self._alphabet = alphabet
+
+	def __missing__(self, c):
+		cls = self._alphabet.classOf(c)
+		if len(self) < MAX_CACHED_CHARS:
+			self[c] = cls
+		return cls
+
+
+class Alphabet:
+
+	'''
+	starts[n] is the first code point of the nth piece, and classes[n] is its
+	class. The first piece always starts at 0.
+
+	An Alphabet built by genAlphabet also knows the conditions it was built
+	from: conditions is the list of them (each only once), and
+	classConditions[cls] is the set of indexes into conditions that the
+	characters in class cls satisfy. A loaded Alphabet doesn't have them.
+	'''
+
+	def __init__(self, starts, classes, numClasses, conditions=None, classConditions=None):
+		self.starts = starts
+		self.classes = classes
+		self.numClasses = numClasses
+		self.conditions = conditions
+		self.classConditions = classConditions
+		self.translatable = numClasses <= MAX_TRANSLATED_CLASSES
+		if self.translatable:
+			self._byteTranslation = bytes(self.classOf(c) for c in range(256))
+			self._translation = _Translation(self)
+
+	def __len__(self):
+		return self.numClasses
+
+
+	def classOf(self, c):
+		'''
+		The class of a character, byte, or code point.
+		'''
+		if not isinstance(c, int):
+			c = ord(c)
+		return self.classes[bisect_right(self.starts, c) - 1]
+
+	def classesOf(self, condition):
+		'''
+		The classes of the characters that satisfy condition.
+		'''
+		classes = set()
+		for first, last in intervals(condition):
+			for n in range(bisect_right(self.starts, first) - 1, bisect_right(self.starts, last)):
+				classes.add(self.classes[n])
+		return sorted(classes)
+
+	def translate(self, text):
+		'''
+		Returns a bytes object with the class of each character in text,
+		which can be a str or bytes. Only for translatable alphabets.
+		'''
+		if isinstance(text, str):
+			if text.isascii():
+				# much faster than str.translate, and most text is ASCII
+				return text.encode('ascii').translate(self._byteTranslation)
+			return text.translate(self._translation).encode('latin-1')
+		return bytes(text).translate(self._byteTranslation)
+
+	def translateBlocks(self, text, start=0):
+		'''
+		Yields the classes of the characters in text (from start on) a block
+		at a time, so a matcher that stops early doesn't pay for translating
+		all of it. Alphabets that aren't translatable look each character up
+		instead.
+		'''
+		for blockStart in range(start, len(text), TRANSLATE_BLOCK_SIZE):
+			block = text[blockStart:blockStart + TRANSLATE_BLOCK_SIZE]
+			if self.translatable:
+				yield self.translate(block)
+			else:
+				yield [self.classOf(c) for c in block]
+
+	def iterClasses(self, text, start=0):
+		'''
+		The classes of the characters in text (from start on) one at a time,
+		though they're still translated a block at a time.
+		'''
+		return chain.from_iterable(self.translateBlocks(text, start))
+
+
+def genAlphabet(conditions):
+	'''
+	Builds the Alphabet for a set of conditions.
+	'''
+	conditions = list(dict.fromkeys(conditions))
+	cuts = {0}
+	for condition in conditions:
+		for first, last in intervals(condition):
+			cuts.add(first)
+			cuts.add(last + 1)
+	starts = sorted(cuts)
+
+	covering = [set() for _ in starts]
+	for n, condition in enumerate(conditions):
+		for first, last in intervals(condition):
+			for piece in range(bisect_right(starts, first) - 1, bisect_right(starts, last)):
+				covering[piece].add(n)
+
+	# pieces covered by the same conditions are in the same class, and
+	# pieces that aren't covered at all are class 0
+	classIds = {frozenset(): 0}
+	classes = array('i')
+	for cover in covering:
+		classes.append(classIds.setdefault(frozenset(cover), len(classIds)))
+	classConditions = [None] * len(classIds)
+	for cover, cls in classIds.items():
+		classConditions[cls] = cover
+	return Alphabet(array('i', starts), classes, len(classIds), conditions, tuple(classConditions))
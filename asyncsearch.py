@@ -0,0 +1,66 @@
+import asyncio
+
+from pyregex import compile
+
+
+
+'''
+Searching asyncio streams for lines that match a regex. Data is matched as it
+arrives, a chunk at a time, with a match stream from the match tester, so a
+line is never joined back together unless it matches.
+
+Matching doesn't block the event loop for long: after every yieldEvery bytes,
+searchStream gives other tasks a chance to run. Any number of streams can be
+searched at once with the same match tester, since each search gets its own
+match stream, and only the DFA cache is shared.
+'''
+
+
+CHUNK_SIZE = 1 << 16
+YIELD_EVERY = 1 << 16
+
+
+async def searchStream(reader, pattern, chunkSize=CHUNK_SIZE, yieldEvery=YIELD_EVERY):
+	'''
+	Yields (lineNumber, line) for each line read from reader (an
+	asyncio.StreamReader) that matches, with lines numbered from 1. pattern is
+	a regex, or a match tester compiled with asBytes set.
+	'''
+	if isinstance(pattern, str):
+		pattern = compile(pattern, asBytes=True)
+	stream = pattern.stream()
+	pieces = []
+	n = 0
+	sinceYield = 0
+	while True:
+		chunk = await reader.read(chunkSize)
+		if len(chunk) == 0:
+			break
+		start = 0
+		while True:
+			end = chunk.find(b'\n', start)
+			if end == -1:
+				break
+			piece = chunk[start:end]
+			stream.feed(piece)
+			pieces.append(piece)
+			n += 1
+			if stream.finish():
+				yield n, b''.join(pieces)
+			pieces = []
+			start = end + 1
+		if start < len(chunk):
+			piece = chunk[start:]
+			stream.feed(piece)
+			pieces.append(piece)
+
+		sinceYield += len(chunk)
+		if sinceYield >= yieldEvery:
+			sinceYield = 0
+			await asyncio.sleep(0)
+
+	# the last line might not end with a newline
+	if len(pieces) > 0:
+		n += 1
+		if stream.finish():
+			yield n, b''.join(pieces)
@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+
+import sys
+import json
+import time
+import random
+import platform
+from argparse import ArgumentParser
+
+from pyregex import ENGINES, Pattern
+from dfa import DFASizeError
+from bitparallel import BitParallelSizeError
+
+
+
+'''
+Benchmarks for how fast each engine compiles and matches. The corpora are
+generated from fixed seeds, so every run searches exactly the same text:
+
+logs          - synthetic log lines, a few of them errors
+alternations  - lines of words drawn from a large vocabulary
+pathological  - long runs of a's and b's, for the patterns that make
+                backtracking engines (or DFA construction) blow up
+longlines     - a few very long lines of random text
+
+Each benchmark is a regex and a corpus. For every engine, it reports the best
+compile time, the throughput (in MB of UTF-8 per second), and the average time
+per line, over a few repeats. Results can be written out as JSON, and compared
+against a previous run's JSON to catch regressions.
+'''
+
+
+RESULTS_VERSION = 1
+DEFAULT_THRESHOLD = 0.2
+
+VOCABULARY = ['w{}x{}'.format(n, n * 7) for n in range(300)]
+LEVELS = ['INFO', 'INFO', 'INFO', 'DEBUG', 'WARN', 'ERROR']
+SERVICES = ['auth', 'billing', 'search', 'upload', 'worker']
+
+
+def genLogs(rand, numLines):
+	lines = []
+	for n in range(numLines):
+		lines.append('2024-05-{:02} {:02}:{:02}:{:02} {} {}-{} request {} took {}ms'.format(
+			rand.randint(1, 28), rand.randint(0, 23), rand.randint(0, 59), rand.randint(0, 59),
+			rand.choice(LEVELS), rand.choice(SERVICES), rand.randint(1, 64),
+			rand.getrandbits(32), rand.randint(1, 5000)))
+	return lines
+
+
+def genAlternations(rand, numLines):
+	return [' '.join(rand.choice(VOCABULARY) + rand.choice(['', 'y']) for _ in range(8)) for _ in range(numLines)]
+
+
+def genPathological(rand, numLines):
+	return [''.join(rand.choice('aaab') for _ in range(rand.randint(20, 200))) for _ in range(numLines)]
+
+
+def genLongLines(rand, numLines):
+	return [''.join(rand.choice('abcdefghijklmnopqrstuvwxyz ') for _ in range(50000)) for _ in range(numLines)]
+
+
+CORPORA = {
+	'logs': (genLogs, 2000),
+	'alternations': (genAlternations, 1000),
+	'pathological': (genPathological, 1000),
+	'longlines': (genLongLines, 2),
+}
+
+
+BENCHMARKS = [
+	('log-literal', 'ERROR', 'logs'),
+	('log-alternation', '(ERROR|WARN) (auth|billing)', 'logs'),
+	('log-anchored', '^2024-05-1(1|2) ', 'logs'),
+	('log-suffix', 'took (1|2|3)(0|5)ms$', 'logs'),
+	('alternation-300', '|'.join(VOCABULARY) + 'y', 'alternations'),
+	('nested-star', '(a*)*b', 'pathological'),
+	('nested-alternation', '(a|aa)*bb', 'pathological'),
+	('dfa-blowup', '(a|b)*a(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)c', 'pathological'),
+	('long-lines', '(ab|cd)*zzq+x', 'longlines'),
+]
+
+
+def genCorpus(name, scale=1.0):
+	gen, numLines = CORPORA[name]
+	return gen(random.Random(name), max(1, int(numLines * scale)))
+
+
+def runBenchmark(regex, lines, mode, repeat=3):
+	'''
+	Returns the best compile time and match time, in seconds, over repeat
+	runs. Raises DFASizeError (or BitParallelSizeError) if the engine can't
+	build the pattern.
+	'''
+	compileTime = matchTime = float('inf')
+	for _ in range(repeat):
+		start = time.perf_counter()
+		pattern = Pattern(regex, mode)
+		compileTime = min(compileTime, time.perf_counter() - start)
+
+		matches = pattern.matches
+		start = time.perf_counter()
+		for ln in lines:
+			matches(ln)
+		matchTime = min(matchTime, time.perf_counter() - start)
+	return compileTime, matchTime
+
+
+def runAll(modes, benchmarks=None, scale=1.0, repeat=3, log=None):
+	results = []
+	corpora = {}
+	for name, regex, corpusName in BENCHMARKS:
+		if benchmarks is not None and name not in benchmarks:
+			continue
+		if corpusName not in corpora:
+			corpora[corpusName] = genCorpus(corpusName, scale)
+		lines = corpora[corpusName]
+		size = sum(len(ln.encode('utf-8')) for ln in lines)
+		for mode in modes:
+			result = {'benchmark': name, 'engine': mode}
+			try:
+				compileTime, matchTime = runBenchmark(regex, lines, mode, repeat)
+				result['compileSeconds'] = compileTime
+				result['mbPerSecond'] = size / 1e6 / matchTime if matchTime > 0 else float('inf')
+				result['lineLatencyMicros'] = matchTime / len(lines) * 1e6
+			except (DFASizeError, BitParallelSizeError) as e:
+				result['error'] = str(e)
+			if log is not None:
+				log(formatResult(result))
+			results.append(result)
+	return results
+
+
+def compareResults(results, baseline, threshold=DEFAULT_THRESHOLD):
+	'''
+	Returns a description of each result that's more than threshold (a
+	fraction) worse than the same benchmark and engine in baseline.
+	'''
+	previous = {(result['benchmark'], result['engine']): result for result in baseline['results']}
+	regressions = []
+	for result in results:
+		old = previous.get((result['benchmark'], result['engine']))
+		if old is None or 'error' in old:
+			continue
+		name = '{} {}'.format(result['benchmark'], result['engine'])
+		if 'error' in result:
+			regressions.append('{}: {}'.format(name, result['error']))
+			continue
+		if result['mbPerSecond'] < old['mbPerSecond'] * (1 - threshold):
+			regressions.append('{}: {:.3f} MB/s, was {:.3f} MB/s'.format(name, result['mbPerSecond'], old['mbPerSecond']))
+		if result['compileSeconds'] > old['compileSeconds'] * (1 + threshold):
+			regressions.append('{}: compiled in {:.4f}s, was {:.4f}s'.format(name, result['compileSeconds'], old['compileSeconds']))
+	return regressions
+
+
+def formatResult(result):
+	if 'error' in result:
+		return '{:<20} {:<12} {}'.format(result['benchmark'], result['engine'], result['error'])
+	return '{:<20} {:<12} compile {:>9.4f}s  {:>9.3f} MB/s  {:>10.2f} us/line'.format(
+		result['benchmark'], result['engine'], result['compileSeconds'],
+		result['mbPerSecond'], result['lineLatencyMicros'])
+
+
+
+''' main and friends ------------------------------- '''
+
+
+def main():
+	argparser = ArgumentParser(description='Benchmark compile and match speed of the engines.')
+	argparser.add_argument('-e', '--engines', nargs='+', choices=ENGINES.keys(), default=list(ENGINES.keys()), help='The engines to benchmark.')
+	argparser.add_argument('-B', '--benchmarks', nargs='+', choices=[name for name, _, _ in BENCHMARKS], help='Only run these benchmarks.')
+	argparser.add_argument('-s', '--scale', type=float, default=1.0, help='Scale the size of the corpora by this much.')
+	argparser.add_argument('-r', '--repeat', type=int, default=3, help='Report the best of this many runs.')
+	argparser.add_argument('-o', '--output', metavar='FILE', help='Write the results to FILE as JSON.')
+	argparser.add_argument('--json', action='store_true', help='Print the results as JSON instead of a table.')
+	argparser.add_argument('--baseline', metavar='FILE', help='Compare against results saved with --output, and exit with 1 on a regression.')
+	argparser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='How much worse (as a fraction) counts as a regression.')
+	args = argparser.parse_args()
+
+	log = None if args.json else print
+	results = runAll(args.engines, args.benchmarks, args.scale, args.repeat, log)
+	output = {
+		'version': RESULTS_VERSION,
+		'python': platform.python_version(),
+		'scale': args.scale,
+		'results': results,
+	}
+	if args.json:
+		print(json.dumps(output, indent=2))
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(output, f, indent=2)
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+		regressions = compareResults(results, baseline, args.threshold)
+		for regression in regressions:
+			print('REGRESSION ' + regression, file=sys.stderr)
+		sys.exit(1 if regressions else 0)
+
+
+
+
+if __name__ == '__main__':
+	main()
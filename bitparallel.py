@@ -0,0 +1,180 @@
+from program import genProgram, AT_START, AT_END
+
+
+
+'''
+The bit-parallel match tester simulates the NFA with the set of active states
+packed into a single int, with one bit per state of the Program. Everything
+is precomputed as masks:
+
+classMasks[cls]    - the states whose condition is satisfied by characters
+                     in class cls of the regex's Alphabet
+followTables[k][b] - the union of the successors of the states in byte b of
+                     the active set, where byte k holds states 8k to 8k+7
+
+A step ANDs the active set with the mask for the character, then ORs together
+the follow table entries for each non-zero byte of what's left. Nothing is
+allocated besides the ints, and memory use only depends on the pattern, which
+makes it a predictable alternative to the DFA engines.
+
+That memory does grow with the square of the number of states, though: there
+are 256 follow table entries for every 8 states, and each one is as wide as
+the whole active set. So, like the DFA engines, the number of states is
+bounded by maxStates, and bigger patterns raise a BitParallelSizeError.
+'''
+
+
+CHUNK_BITS = 8
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+class BitParallelSizeError(Exception):
+	pass
+
+
+def toMask(states):
+	mask = 0
+	for state in states:
+		mask |= 1 << state
+	return mask
+
+
+class BitParallelMatchTester:
+
+	'''
+	maxStates bounds the number of states in the Program, and with it the
+	size of the follow tables (about 15MB at the default). If the regex's
+	prefilter is exact, matching never gets past it, so no tables are built
+	(and there's no limit) unless a stream needs them.
+	'''
+
+	def __init__(self, regex, maxStates=2000, asBytes=False, matchStats=None):
+		program = genProgram(regex, asBytes, matchStats=matchStats)
+		self._prefilter = program.prefilter
+		self._maxStates = maxStates
+		self._program = program
+		if self._prefilter is None or not self._prefilter.exact:
+			self._genTables()
+
+	def _genTables(self):
+		program = self._program
+		if len(program) > self._maxStates:
+			raise BitParallelSizeError('Program has {} states, more than {}'.format(len(program), self._maxStates))
+		self._exitBit = 1 << program.exit
+		self._enterMask = toMask(program.enterClosure)
+		self._startMask = toMask(program.closures[AT_START][program.enter])
+
+		endClosures = program.closures[AT_END]
+		self._endMask = toMask(state for state in range(len(program)) if program.exit in endClosures[state])
+
+		printing = [
+			state for state in range(len(program))
+			if program.conditions[state] is not None and not program.nonprinting[state]
+		]
+		self._alphabet = program.alphabet
+		self._classMasks = [0] * self._alphabet.numClasses
+		for state in printing:
+			for cls in self._alphabet.classesOf(program.conditions[state]):
+				self._classMasks[cls] |= 1 << state
+
+		successorMasks = [toMask(successors) for successors in program.successors]
+		self._followTables = []
+		for low in range(0, len(program), CHUNK_BITS):
+			table = [0] * (CHUNK_MASK + 1)
+			for byte in range(1, CHUNK_MASK + 1):
+				# build on the entry without the highest bit
+				high = byte.bit_length() - 1
+				table[byte] = table[byte & ~(1 << high)]
+				if low + high < len(program):
+					table[byte] |= successorMasks[low + high]
+			self._followTables.append(table)
+		# the tables are all that's needed from here on
+		self._program = None
+
+	@property
+	def prefilter(self):
+		return self._prefilter
+
+
+	def matches(self, testStr):
+		prefilter = self._prefilter
+		if prefilter is not None:
+			if not prefilter.mayMatch(testStr):
+				return False
+			if prefilter.exact:
+				return True
+		active = self._consume(self._startMask, testStr)
+		return active is None or (active & self._endMask) != 0
+
+	def _consume(self, active, text):
+		'''
+		Returns the active set after consuming text, or None if the regex
+		matches before the end of it.
+		'''
+		exitBit = self._exitBit
+		enterMask = self._enterMask
+		classMasks = self._classMasks
+		followTables = self._followTables
+
+		if active & exitBit:
+			return None
+		for classes in self._alphabet.translateBlocks(text):
+			for cls in classes:
+				consumed = active & classMasks[cls]
+				active = enterMask
+				chunk = 0
+				while consumed:
+					byte = consumed & CHUNK_MASK
+					if byte:
+						active |= followTables[chunk][byte]
+					consumed >>= CHUNK_BITS
+					chunk += 1
+				if active & exitBit:
+					return None
+		return active
+
+	def stream(self):
+		'''
+		Returns a new BitParallelMatchStream, for matching input a piece at a
+		time.
+		'''
+		if self._program is not None:
+			self._genTables()
+		return BitParallelMatchStream(self)
+
+
+class BitParallelMatchStream:
+
+	'''
+	Tests whether input that arrives a piece at a time matches. Only the
+	active set is kept between pieces. The prefilter isn't used, since a
+	literal can be split between pieces.
+	'''
+
+	def __init__(self, matchTester):
+		self._matchTester = matchTester
+		self.reset()
+
+
+	def reset(self):
+		self._active = self._matchTester._startMask
+		self.matched = False
+
+	def feed(self, chunk):
+		'''
+		Consumes the next piece of input, and returns whether there's been a
+		match yet.
+		'''
+		if not self.matched:
+			self._active = self._matchTester._consume(self._active, chunk)
+			self.matched = self._active is None
+		return self.matched
+
+	def finish(self):
+		'''
+		Ends the input, and returns whether it matched. The stream is then
+		reset for the next input.
+		'''
+		matched = self.matched or (self._active & self._matchTester._endMask) != 0
+		self.reset()
+		return matched
@@ -0,0 +1,191 @@
+from bisect import bisect_right
+
+
+
+'''
+A CharClass is a set of characters, like [a-z], [^0-9], '.' or \\d, stored as
+a sorted list of (first, last) intervals of code points. A class is a single
+condition in the state machine, so however many characters it has, it costs
+one state and one transition instead of one per character.
+
+Membership is a lookup in a table for the first 256 code points (which is
+where nearly all of the characters being tested are), and a bisect over the
+intervals for the rest.
+
+When matching bytes, a class of code points is turned into the UTF-8
+sequences that encode them (see utf8Sequences), with a CharClass of byte
+values for each byte. Like a byte for each character of a literal, the bytes
+of a sequence are matched one after the other.
+'''
+
+
+MAX_CODE_POINT = 0x10FFFF
+SURROGATES = (0xD800, 0xDFFF)
+# the largest code point that encodes to 1, 2 and 3 bytes of UTF-8
+UTF8_LENGTH_LIMITS = (0x7F, 0x7FF, 0xFFFF)
+
+
+class CharClass:
+
+	'''
+	intervals is an iterable of (first, last) pairs of code points (or byte
+	values), which can overlap and be in any order. A CharClass never changes,
+	and ones with the same characters are equal, so they can be used as dict
+	keys.
+	'''
+
+	def __init__(self, intervals):
+		self.intervals = _normalize(intervals)
+		self._starts = [first for first, _ in self.intervals]
+		low = bytearray(256)
+		for first, last in self.intervals:
+			for c in range(first, min(last, 255) + 1):
+				low[c] = 1
+		self._low = bytes(low)
+
+	def __contains__(self, c):
+		if not isinstance(c, int):
+			c = ord(c)
+		if c < 256:
+			return self._low[c] == 1
+		n = bisect_right(self._starts, c) - 1
+		return n >= 0 and c <= self.intervals[n][1]
+
+	def __len__(self):
+		return sum(last - first + 1 for first, last in self.intervals)
+
+	def __iter__(self):
+		for first, last in self.intervals:
+			yield from range(first, last + 1)
+
+	def __eq__(self, other):
+		if not isinstance(other, CharClass):
+			return NotImplemented
+		return self.intervals == other.intervals
+
+	def __hash__(self):
+		return hash(self.intervals)
+
+
+	def negated(self):
+		'''
+		Every character that isn't in this class.
+		'''
+		intervals = []
+		nextFirst = 0
+		for first, last in self.intervals:
+			if first > nextFirst:
+				intervals.append((nextFirst, first - 1))
+			nextFirst = last + 1
+		if nextFirst <= MAX_CODE_POINT:
+			intervals.append((nextFirst, MAX_CODE_POINT))
+		return CharClass(intervals)
+
+	def union(self, other):
+		return CharClass(self.intervals + other.intervals)
+
+	def __str__(self):
+		parts = []
+		for first, last in self.intervals:
+			if first == last:
+				parts.append(_show(first))
+			else:
+				parts.append('{}-{}'.format(_show(first), _show(last)))
+		return '[' + ''.join(parts) + ']'
+
+	def __repr__(self):
+		return 'CharClass({!r})'.format(self.intervals)
+
+
+def _normalize(intervals):
+	'''
+	Sorts intervals and merges the ones that overlap or touch.
+	'''
+	merged = []
+	for first, last in sorted(intervals):
+		if len(merged) > 0 and first <= merged[-1][1] + 1:
+			merged[-1] = (merged[-1][0], max(last, merged[-1][1]))
+		else:
+			merged.append((first, last))
+	return tuple(merged)
+
+
+def _show(c):
+	if 0x20 < c < 0x7F and chr(c) not in '\\]-^':
+		return chr(c)
+	if c <= 0xFF:
+		return '\\x{:02x}'.format(c)
+	if c <= 0xFFFF:
+		return '\\u{:04x}'.format(c)
+	return '\\U{:08x}'.format(c)
+
+
+def charRange(first, last):
+	return CharClass([(ord(first), ord(last))])
+
+
+DIGIT = charRange('0', '9')
+WORD = CharClass([(ord('0'), ord('9')), (ord('A'), ord('Z')), (ord('_'), ord('_')), (ord('a'), ord('z'))])
+SPACE = CharClass([(ord('\t'), ord('\r')), (ord(' '), ord(' '))])
+# '.' matches anything but a newline, like in Python's re
+DOT = charRange('\n', '\n').negated()
+
+SHORTHANDS = {
+	'd': DIGIT,
+	'w': WORD,
+	's': SPACE,
+	'D': DIGIT.negated(),
+	'W': WORD.negated(),
+	'S': SPACE.negated(),
+}
+
+
+def utf8Sequences(charClass):
+	'''
+	Returns the UTF-8 encodings of the characters in charClass, as a list of
+	sequences of byte CharClasses, e.g. [à-ÿ] is the single sequence of
+	bytes 0xc3 then 0xa0 to 0xbf. Surrogates can't be encoded, so they're left
+	out. (This is the same way RE2 and Rust's regex crate do it.)
+	'''
+	sequences = []
+	toProcess = list(reversed(charClass.intervals))
+	while len(toProcess) > 0:
+		first, last = toProcess.pop()
+		pieces = _splitUTF8Range(first, last)
+		if pieces is not None:
+			toProcess += reversed(pieces)
+			continue
+		encodedFirst = chr(first).encode('utf-8')
+		encodedLast = chr(last).encode('utf-8')
+		sequences.append(tuple(CharClass([(a, b)]) for a, b in zip(encodedFirst, encodedLast)))
+	return sequences
+
+
+def _splitUTF8Range(first, last):
+	'''
+	Splits first to last into pieces if it needs to be, or returns None if
+	its encodings are already a sequence of byte ranges. That's the case when
+	they all have the same length, and each byte is the same at both ends of
+	the range unless all of the bytes after it cover their whole range.
+	'''
+	if first <= SURROGATES[1] and last >= SURROGATES[0]:
+		pieces = []
+		if first < SURROGATES[0]:
+			pieces.append((first, SURROGATES[0] - 1))
+		if last > SURROGATES[1]:
+			pieces.append((SURROGATES[1] + 1, last))
+		return pieces
+	for limit in UTF8_LENGTH_LIMITS:
+		if first <= limit < last:
+			return [(first, limit), (limit + 1, last)]
+	if last <= UTF8_LENGTH_LIMITS[0]:
+		return None
+	for n in range(1, 4):
+		# the bits held in the last n bytes
+		mask = (1 << (6 * n)) - 1
+		if first & ~mask != last & ~mask:
+			if first & mask != 0:
+				return [(first, first | mask), ((first | mask) + 1, last)]
+			if last & mask != mask:
+				return [(first, (last & ~mask) - 1), (last & ~mask, last)]
+	return None
@@ -0,0 +1,237 @@
+from dfa import DFABuilder, DFAMatchStream
+from program import genProgram
+from matchstats import timePhase
+
+
+
+'''
+For the hottest patterns, a DFA can be turned into Python source, with the
+transition table written out as code, and then compiled into a function with
+exec. Each state becomes a block of code that consumes characters, looping for
+as long as the DFA stays in the same state, so the only dispatch on the state
+happens when it changes:
+
+	while True:
+		if state == 0:
+			for cls in classes:
+				if cls == 1:
+					state = 1
+					break
+				if cls == 2 or cls == 3:
+					return True
+			else:
+				break
+		elif state == 1:
+			...
+
+classes is an iterator over the input's alphabet classes (see alphabet.py),
+which every state's loop shares. Going to the matching state is just return
+True, and going to a dead state (one that can't reach a match) is return
+False. The generated function is kept by the CodegenMatchTester, so it's
+cached along with the pattern.
+'''
+
+
+INDENT = '\t'
+
+
+class CodeWriter:
+	def __init__(self):
+		self.lines = []
+		self.depth = 0
+
+	def line(self, text):
+		self.lines.append(INDENT * self.depth + text)
+
+	def indent(self):
+		self.depth += 1
+
+	def dedent(self):
+		self.depth -= 1
+
+	def source(self):
+		return '\n'.join(self.lines) + '\n'
+
+
+def _setLiteral(values):
+	'''
+	Python compiles 'x in {1, 2}' with a constant frozenset, so membership
+	tests against set literals don't build a set each time.
+	'''
+	return '{' + ', '.join(map(str, sorted(values))) + '}'
+
+
+def _condition(classes):
+	if len(classes) == 1:
+		return 'cls == {}'.format(classes[0])
+	if len(classes) <= 3:
+		return ' or '.join('cls == {}'.format(cls) for cls in classes)
+	return 'cls in ' + _setLiteral(classes)
+
+
+class DFACodeGen:
+
+	'''
+	Generates the source of a function that tests whether a DFA matches. The
+	function is called name, and expects translateBlocks and prefilter to be
+	in its globals.
+	'''
+
+	def __init__(self, dfa, name='matches'):
+		self.dfa = dfa
+		self.name = name
+
+	def genSource(self):
+		dfa = self.dfa
+		numStates = dfa.numStates
+		rows = [dfa.table[n * dfa.numClasses:(n + 1) * dfa.numClasses] for n in range(numStates)]
+		targets = [[offset // dfa.numClasses for offset in row] for row in rows]
+		matchState = dfa.matchState // dfa.numClasses if dfa.matchState >= 0 else None
+		dead = self._deadStates(targets, matchState)
+
+		out = CodeWriter()
+		out.line('def {}(testStr):'.format(self.name))
+		out.indent()
+		if dfa.prefilter is not None:
+			out.line('if not prefilter.mayMatch(testStr):')
+			out.line(INDENT + 'return False')
+			if dfa.prefilter.exact:
+				out.line('return True')
+				return out.source()
+		start = dfa.start // dfa.numClasses
+		if start == matchState:
+			out.line('return True')
+			return out.source()
+		if start in dead:
+			out.line('return False')
+			return out.source()
+
+		out.line('state = {}'.format(start))
+		out.line('for classes in translateBlocks(testStr):')
+		out.indent()
+		out.line('classes = iter(classes)')
+		out.line('while True:')
+		out.indent()
+		live = [n for n in range(numStates) if n != matchState and n not in dead]
+		for n, state in enumerate(live):
+			if len(live) == 1:
+				# nothing to dispatch on
+				self._genState(out, state, targets[state], matchState, dead)
+				break
+			if n == len(live) - 1:
+				out.line('else:')
+			else:
+				out.line('{} state == {}:'.format('if' if n == 0 else 'elif', state))
+			out.indent()
+			self._genState(out, state, targets[state], matchState, dead)
+			out.dedent()
+		out.dedent()
+		out.dedent()
+		endAccepts = [n for n in live if dfa.endAccepts[n * dfa.numClasses]]
+		if len(endAccepts) == 0:
+			out.line('return False')
+		else:
+			out.line('return state in ' + _setLiteral(endAccepts))
+		return out.source()
+
+
+	def _deadStates(self, targets, matchState):
+		'''
+		The states that can't reach the match state, even at the end of the
+		input.
+		'''
+		live = {matchState} if matchState is not None else set()
+		live.update(n for n in range(len(targets)) if self.dfa.endAccepts[n * self.dfa.numClasses])
+		changed = True
+		while changed:
+			changed = False
+			for n, row in enumerate(targets):
+				if n not in live and any(target in live for target in row):
+					live.add(n)
+					changed = True
+		return frozenset(n for n in range(len(targets)) if n not in live)
+
+	def _genState(self, out, state, row, matchState, dead):
+		byTarget = {}
+		for cls, target in enumerate(row):
+			byTarget.setdefault(target, []).append(cls)
+		if list(byTarget) == [state]:
+			# the rest of the input can't change anything
+			out.line('return {}'.format(bool(self.dfa.endAccepts[state * self.dfa.numClasses])))
+			return
+		# the most common target is left for last, so it doesn't need a test
+		default = max(byTarget, key=lambda target: (len(byTarget[target]), target == state))
+
+		out.line('for cls in classes:')
+		out.indent()
+		for target, classes in sorted(byTarget.items()):
+			if target == default:
+				continue
+			out.line('if {}:'.format(_condition(classes)))
+			out.indent()
+			self._genTransition(out, state, target, matchState, dead)
+			out.dedent()
+		if default != state:
+			self._genTransition(out, state, default, matchState, dead)
+		out.dedent()
+		out.line('else:')
+		out.line(INDENT + 'break')
+
+	def _genTransition(self, out, state, target, matchState, dead):
+		if target == matchState:
+			out.line('return True')
+		elif target in dead:
+			out.line('return False')
+		elif target == state:
+			out.line('continue')
+		else:
+			out.line('state = {}'.format(target))
+			out.line('break')
+
+
+class CodegenMatchTester:
+
+	'''
+	Runs a DFA that's been compiled to Python. Building one means building
+	the whole DFA first, so maxStates bounds its size just like for the
+	DFAMatchTester. If matchStats is given, the time spent compiling is
+	recorded in it.
+
+	If the regex's prefilter is exact, it decides every match by itself, so
+	nothing is built and source is None. Streams run the DFA itself (with a
+	DFAMatchStream), which is then built if it hasn't been.
+	'''
+
+	def __init__(self, regex, maxStates=1000, asBytes=False, matchStats=None):
+		program = genProgram(regex, asBytes, matchStats=matchStats)
+		self._prefilter = program.prefilter
+		self._builder = DFABuilder(program, maxStates)
+		self._dfa = None
+		if self._prefilter is not None and self._prefilter.exact:
+			self.source = None
+			self._matches = self._prefilter.mayMatch
+			return
+		with timePhase(matchStats, 'DFABuilder'):
+			dfa = self._dfa = self._builder.genDFA()
+		self._builder = None
+		with timePhase(matchStats, 'DFACodeGen'):
+			self.source = DFACodeGen(dfa).genSource()
+			namespace = {'translateBlocks': dfa.alphabet.translateBlocks, 'prefilter': dfa.prefilter}
+			exec(compile(self.source, '<pyregex {!r}>'.format(regex), 'exec'), namespace)
+		self._matches = namespace['matches']
+
+	@property
+	def prefilter(self):
+		return self._prefilter
+
+
+	def matches(self, testStr):
+		return self._matches(testStr)
+
+	def stream(self):
+		'''
+		Returns a new DFAMatchStream, for matching input a piece at a time.
+		'''
+		if self._dfa is None:
+			self._dfa = self._builder.genDFA()
+		return DFAMatchStream(self._dfa)
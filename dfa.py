@@ -0,0 +1,303 @@
+from array import array
+
+from program import genProgram, AT_START, AT_END
+from matchstats import timePhase
+
+
+
+'''
+This file contains tools for compiling a Program (an NFA) into a complete,
+minimized deterministic finite automaton ahead of time, and a match tester
+that runs it.
+
+The DFA is built with the subset construction over the whole state graph and
+then minimized with Hopcroft's algorithm. Characters are first mapped to a
+class of the regex's Alphabet (see alphabet.py), so everything that doesn't
+appear in the regex shares class 0. The transitions are stored in one flat
+array('i'), with a row of numClasses entries for each state. States are
+identified by the offset of their row, so taking a transition is a single
+index into the table, and the input is translated into classes a block at a
+time before it's run.
+
+Since the match testers search for a match anywhere in the string, the DFA
+stops at the first match. All matching states are merged into a single
+absorbing state, which lets the matcher bail out as soon as it's reached.
+'''
+
+
+class DFASizeError(Exception):
+	pass
+
+
+class DFA:
+
+	'''
+	A minimized DFA. start and matchState are row offsets into table (or -1
+	if nothing ever matches), and endAccepts[offset] says whether a string
+	ending in that state matches (i.e. the state can consume '$'). The
+	prefilter is carried over from the Program.
+	'''
+
+	def __init__(self, alphabet, table, start, matchState, endAccepts, prefilter=None):
+		self.prefilter = prefilter
+		self.alphabet = alphabet
+		self.numClasses = alphabet.numClasses
+		self.table = table
+		self.start = start
+		self.matchState = matchState
+		self.endAccepts = endAccepts
+
+	@property
+	def numStates(self):
+		return len(self.table) // self.numClasses
+
+
+class DFABuilder:
+
+	'''
+	Builds a DFA from a Program. maxStates bounds the number of states in the
+	DFA before it's minimized, and maxSubsetEntries bounds the total size of
+	the sets of NFA states they stand for, which is what the construction's
+	memory use grows with. The subsets can be big even when there aren't
+	many of them, e.g. each state of a{n} stands for up to n NFA states.
+	'''
+
+	def __init__(self, program, maxStates=100000, maxSubsetEntries=1000000):
+		self.program = program
+		self.maxStates = maxStates
+		self.maxSubsetEntries = maxSubsetEntries
+
+	def genDFA(self):
+		alphabet = self.program.alphabet
+		transitions, isMatch, endAccepts = self._subsetConstruction(alphabet)
+		return self._minimize(alphabet, transitions, isMatch, endAccepts)
+
+
+	def _subsetConstruction(self, alphabet):
+		'''
+		Returns the transitions of the unminimized DFA as a list of rows,
+		along with which states match. State 0 is the start state.
+		'''
+		program = self.program
+		numClasses = alphabet.numClasses
+		stateClasses = [
+			alphabet.classesOf(condition) if condition is not None and not program.nonprinting[state] else ()
+			for state, condition in enumerate(program.conditions)
+		]
+		enterClosure = frozenset(program.enterClosure)
+		start = frozenset(program.closures[AT_START][program.enter])
+		endClosures = program.closures[AT_END]
+		ids = {start: 0}
+		subsets = [start]
+		entries = len(start)
+		transitions = []
+		isMatch = []
+		endAccepts = []
+
+		while len(transitions) < len(subsets):
+			states = subsets[len(transitions)]
+			match = program.exit in states
+			isMatch.append(match)
+			endAccepts.append(match or any(program.exit in endClosures[state] for state in states))
+
+			targets = [set(enterClosure) for _ in range(numClasses)]
+			if not match:
+				for state in states:
+					for cls in stateClasses[state]:
+						targets[cls].update(program.successors[state])
+
+			row = []
+			for cls in range(numClasses):
+				if match:
+					# matches are absorbing, see above
+					row.append(len(transitions))
+					continue
+				nextStates = frozenset(targets[cls])
+				if nextStates not in ids:
+					if len(subsets) >= self.maxStates:
+						raise DFASizeError('DFA has more than {} states'.format(self.maxStates))
+					entries += len(nextStates)
+					if entries > self.maxSubsetEntries:
+						raise DFASizeError('DFA states stand for more than {} NFA states in total'.format(self.maxSubsetEntries))
+					ids[nextStates] = len(subsets)
+					subsets.append(nextStates)
+				row.append(ids[nextStates])
+			transitions.append(row)
+
+		return transitions, isMatch, endAccepts
+
+
+	def _minimize(self, alphabet, transitions, isMatch, endAccepts):
+		'''
+		Hopcroft's algorithm. Starts with the states partitioned by how they
+		accept, then keeps splitting blocks until every state in a block
+		transitions into the same blocks as the others.
+		'''
+		numStates = len(transitions)
+		numClasses = alphabet.numClasses
+
+		inverse = [[[] for _ in range(numStates)] for _ in range(numClasses)]
+		for state, row in enumerate(transitions):
+			for cls, target in enumerate(row):
+				inverse[cls][target].append(state)
+
+		initial = {}
+		for state in range(numStates):
+			initial.setdefault((isMatch[state], endAccepts[state]), set()).add(state)
+		blocks = list(initial.values())
+		blockOf = [0] * numStates
+		for n, block in enumerate(blocks):
+			for state in block:
+				blockOf[state] = n
+
+		worklist = set(range(len(blocks)))
+		while len(worklist) > 0:
+			splitter = list(blocks[worklist.pop()])
+			for cls in range(numClasses):
+				predecessors = {}
+				for target in splitter:
+					for state in inverse[cls][target]:
+						predecessors.setdefault(blockOf[state], set()).add(state)
+
+				for n, inside in predecessors.items():
+					block = blocks[n]
+					if len(inside) == len(block):
+						continue
+					outside = block - inside
+					blocks[n] = inside
+					blocks.append(outside)
+					newN = len(blocks) - 1
+					for state in outside:
+						blockOf[state] = newN
+					if n in worklist or len(outside) <= len(inside):
+						worklist.add(newN)
+					else:
+						worklist.add(n)
+
+		# renumber the blocks so the start state comes first, then lay out
+		# the table with states identified by their row offset
+		order = [blockOf[0]] + [n for n in range(len(blocks)) if n != blockOf[0]]
+		offsets = {}
+		for n, block in enumerate(order):
+			offsets[block] = n * numClasses
+
+		table = array('i', [0]) * (len(blocks) * numClasses)
+		minEndAccepts = bytearray(len(table))
+		matchState = -1
+		for block in order:
+			representative = next(iter(blocks[block]))
+			offset = offsets[block]
+			for cls, target in enumerate(transitions[representative]):
+				table[offset + cls] = offsets[blockOf[target]]
+			minEndAccepts[offset] = endAccepts[representative]
+			if isMatch[representative]:
+				matchState = offset
+
+		return DFA(alphabet, table, 0, matchState, minEndAccepts, self.program.prefilter)
+
+
+class DFAMatchTester:
+
+	'''
+	Builds a DFA from regex, unless an already built one is passed in. If
+	matchStats is given, the time spent compiling is recorded in it.
+
+	If the regex's prefilter is exact, matching never gets past it, so the
+	DFA is only built if something asks for it (e.g. to dump it).
+	'''
+
+	def __init__(self, regex, maxStates=100000, asBytes=False, dfa=None, matchStats=None):
+		self._dfa = dfa
+		self._builder = None
+		if dfa is not None:
+			self._prefilter = dfa.prefilter
+			return
+		program = genProgram(regex, asBytes, matchStats=matchStats)
+		self._prefilter = program.prefilter
+		self._builder = DFABuilder(program, maxStates)
+		if self._prefilter is None or not self._prefilter.exact:
+			with timePhase(matchStats, 'DFABuilder'):
+				self._dfa = self._builder.genDFA()
+
+	@property
+	def dfa(self):
+		if self._dfa is None:
+			self._dfa = self._builder.genDFA()
+		return self._dfa
+
+	@property
+	def prefilter(self):
+		return self._prefilter
+
+
+	def matches(self, testStr):
+		prefilter = self._prefilter
+		if prefilter is not None:
+			if not prefilter.mayMatch(testStr):
+				return False
+			if prefilter.exact:
+				return True
+		dfa = self._dfa
+		table = dfa.table
+		alphabet = dfa.alphabet
+		matchState = dfa.matchState
+		state = dfa.start
+		for classes in alphabet.translateBlocks(testStr):
+			for cls in classes:
+				if state == matchState:
+					return True
+				state = table[state + cls]
+		return bool(dfa.endAccepts[state])
+
+	def stream(self):
+		'''
+		Returns a new DFAMatchStream, for matching input a piece at a time.
+		'''
+		return DFAMatchStream(self.dfa)
+
+
+class DFAMatchStream:
+
+	'''
+	Tests whether input that arrives a piece at a time matches a DFA. Only
+	the current state is kept between pieces. The prefilter isn't used,
+	since a literal can be split between pieces.
+	'''
+
+	def __init__(self, dfa):
+		self._dfa = dfa
+		self.reset()
+
+
+	def reset(self):
+		self._state = self._dfa.start
+		self.matched = self._state == self._dfa.matchState
+
+	def feed(self, chunk):
+		'''
+		Consumes the next piece of input, and returns whether there's been a
+		match yet.
+		'''
+		if self.matched:
+			return True
+		dfa = self._dfa
+		table = dfa.table
+		matchState = dfa.matchState
+		state = self._state
+		for classes in dfa.alphabet.translateBlocks(chunk):
+			for cls in classes:
+				state = table[state + cls]
+				if state == matchState:
+					self.matched = True
+					return True
+		self._state = state
+		return False
+
+	def finish(self):
+		'''
+		Ends the input, and returns whether it matched. The stream is then
+		reset for the next input.
+		'''
+		matched = self.matched or bool(self._dfa.endAccepts[self._state])
+		self.reset()
+		return matched
@@ -0,0 +1,162 @@
+import os
+import mmap
+import stat
+from concurrent.futures import ProcessPoolExecutor
+
+from pyregex import compile
+
+
+
+'''
+Tools for searching files for lines that match a regex. Files are memory
+mapped and searched as bytes, in place, so memory use doesn't depend on the
+size of the file. Pipes, FIFOs and devices can't be memory mapped (and don't
+have a size), so they're read and searched a line at a time instead.
+
+Files can also be searched in parallel with a pool of processes. Each file is
+split into chunks on line boundaries, and each chunk is searched by a worker
+process. Every worker compiles the regex once when it starts, so nothing but
+file names, offsets, and matching lines is sent between processes. Results
+come back in the same order as a serial search would produce them. Files that
+aren't regular files can only be read once, from start to end, so they're
+searched by the calling process while the workers get on with the rest.
+'''
+
+
+MIN_CHUNK_SIZE = 1 << 20
+MAX_CHUNK_SIZE = 1 << 24
+
+
+def searchRange(matchtester, data, start, end, onMatch):
+	'''
+	Searches the lines in data[start:end] (bytes or an mmap), calling
+	onMatch(lineNumber, line) for each match, with lines numbered from 1 at
+	start. Lines are only copied out of data if they get past the prefilter.
+	Returns the number of lines searched.
+	'''
+	prefilter = matchtester.prefilter
+	n = 0
+	while start < end:
+		lineEnd = data.find(b'\n', start, end)
+		if lineEnd == -1:
+			lineEnd = end
+		n += 1
+		if prefilter is None or prefilter.mayMatchRange(data, start, lineEnd):
+			ln = data[start:lineEnd]
+			if matchtester.matches(ln):
+				onMatch(n, ln)
+		start = lineEnd + 1
+	return n
+
+
+def streamSearch(matchtester, toSearch, onMatch):
+	'''
+	Searches the lines of toSearch, a file opened in binary mode, reading
+	it a line at a time. Calls onMatch like searchRange does, and returns
+	the number of lines searched.
+	'''
+	n = 0
+	for n, ln in enumerate(toSearch, 1):
+		ln = ln[:-1] if ln[-1:] == b'\n' else ln
+		if matchtester.matches(ln):
+			onMatch(n, ln)
+	return n
+
+
+def mmapSearch(matchtester, fname, onMatch):
+	with open(fname, 'rb') as toSearch:
+		st = os.fstat(toSearch.fileno())
+		if not stat.S_ISREG(st.st_mode):
+			return streamSearch(matchtester, toSearch, onMatch)
+		if st.st_size == 0:
+			return 0
+		with mmap.mmap(toSearch.fileno(), 0, access=mmap.ACCESS_READ) as data:
+			return searchRange(matchtester, data, 0, len(data), onMatch)
+
+
+def splitFile(fname, chunkSize):
+	'''
+	Splits a file into (start, end) byte ranges of about chunkSize, which
+	always end just after a newline (or at the end of the file). Raises
+	ValueError if it isn't a regular file.
+	'''
+	chunks = []
+	with open(fname, 'rb') as toSplit:
+		st = os.fstat(toSplit.fileno())
+		if not stat.S_ISREG(st.st_mode):
+			raise ValueError('{} is not a regular file, so it can\'t be split'.format(fname))
+		size = st.st_size
+		if size == 0:
+			return chunks
+		with mmap.mmap(toSplit.fileno(), 0, access=mmap.ACCESS_READ) as data:
+			start = 0
+			while start < size:
+				end = data.find(b'\n', min(start + chunkSize, size) - 1)
+				end = size if end == -1 else end + 1
+				chunks.append((start, end))
+				start = end
+	return chunks
+
+
+
+''' Worker Processes ---------------------------------- '''
+
+
+_workerMatchtester = None
+
+
+def _initWorker(regex, mode):
+	global _workerMatchtester
+	_workerMatchtester = compile(regex, mode, asBytes=True)
+
+
+def _searchChunk(fname, start, end):
+	matches = []
+	def onMatch(n, ln):
+		matches.append((n, ln.decode('utf-8', errors='replace')))
+
+	with open(fname, 'rb') as toSearch:
+		with mmap.mmap(toSearch.fileno(), 0, access=mmap.ACCESS_READ) as data:
+			numLines = searchRange(_workerMatchtester, data, start, end, onMatch)
+	return numLines, matches
+
+
+def parallelSearch(regex, mode, fnames, jobs):
+	'''
+	Searches fnames with jobs worker processes. Yields (fname, lineNumber,
+	line) for each matching line, in order.
+	'''
+	tasks = []
+	numChunks = []
+	for fname in fnames:
+		if not os.path.isfile(fname):
+			# searched in this process, see above
+			numChunks.append(None)
+			continue
+		size = os.path.getsize(fname)
+		chunkSize = max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, -(-size // jobs)))
+		chunks = splitFile(fname, chunkSize)
+		numChunks.append(len(chunks))
+		for start, end in chunks:
+			tasks.append((fname, start, end))
+
+	matchtester = None
+	with ProcessPoolExecutor(jobs, initializer=_initWorker, initargs=(regex, mode)) as executor:
+		results = executor.map(_searchChunk, *zip(*tasks)) if len(tasks) > 0 else iter(())
+		for fname, count in zip(fnames, numChunks):
+			if count is None:
+				if matchtester is None:
+					matchtester = compile(regex, mode, asBytes=True)
+				matches = []
+				with open(fname, 'rb') as toSearch:
+					streamSearch(matchtester, toSearch, lambda n, ln: matches.append((n, ln.decode('utf-8', errors='replace'))))
+				for n, ln in matches:
+					yield fname, n, ln
+				continue
+
+			lineOffset = 0
+			for _ in range(count):
+				numLines, matches = next(results)
+				for n, ln in matches:
+					yield fname, lineOffset + n, ln
+				lineOffset += numLines
@@ -0,0 +1,324 @@
+from program import genProgram, AT_START, AT_END
+from matchtester import MatchStream
+
+
+
+'''
+The lazy DFA match tester runs the same nondeterministic finite automaton as
+the MatchTester, but it remembers every set of NFA states that it runs into.
+Each of those sets becomes a DFA state, and the transitions between them are
+cached the first time they're taken (the same trick as docs/dfa1.c). Once the
+DFA has warmed up, consuming a character is a single dict lookup.
+
+Some regexes have exponentially many DFA states, so the cache is bounded. When
+it fills up it's thrown away and rebuilt from scratch, and if a single match
+keeps flushing the cache we give up on it and carry on with the plain NFA
+simulation from the MatchTester, starting from the current DFA state's NFA
+states.
+
+The cache itself lives in LazyDFA, which works on any Program, so it can be
+shared by other matchers (e.g. RegexSet) that need different bookkeeping. The
+cache is the only thing that changes while matching, and it's only ever added
+to or swapped out for a new one, so one LazyDFA can be used by many threads at
+once. Everything else a match needs is kept in local variables.
+'''
+
+
+class DFAState:
+
+	'''
+	A set of NFA states, along with the cached transitions out of it, which
+	are keyed by alphabet class (see alphabet.py), so there are never more
+	of them than the Program's alphabet has classes. tags holds the tags of
+	any tagged exits in the set.
+	'''
+
+	def __init__(self, states, isMatch, tags):
+		self.states = states
+		self.isMatch = isMatch
+		self.tags = tags
+		self.transitions = {}
+		self.matchesAtEnd = None
+		self.endTags = None
+
+
+class DFACacheStats:
+
+	'''
+	Counters describing how well the DFA cache is working.
+	'''
+
+	def __init__(self):
+		self.hits = 0
+		self.misses = 0
+		self.flushes = 0
+		self.fallbacks = 0
+
+	def __str__(self):
+		return 'DFACacheStats(hits={}, misses={}, flushes={}, fallbacks={})'.format(
+			self.hits, self.misses, self.flushes, self.fallbacks)
+
+
+class LazyDFA:
+
+	'''
+	The cache of DFA states for a Program. maxStates bounds the number of
+	cached DFA states, and maxFlushes is the number of times the cache may be
+	flushed during a single match before it's exhausted (or None to flush as
+	often as needed).
+
+	Matchers walk the DFA themselves, translating the input into the
+	Program's alphabet classes, starting at start and looking up
+	dstate.transitions[cls], and only call transition when that misses. A
+	matcher notes the generation when it starts, and after each miss checks
+	whether the cache has been exhausted since then.
+
+	By default the DFA looks for a match starting anywhere, so the Program's
+	enter state is added back in after every character. An anchored DFA only
+	looks for matches starting where it starts, and can be started at a
+	position other than the beginning of the input with startAt.
+	'''
+
+	def __init__(self, program, maxStates=10000, maxFlushes=3, anchored=False):
+		self.program = program
+		self.anchored = anchored
+		self.stats = DFACacheStats()
+		self.generation = 0
+		self._maxStates = maxStates
+		self._maxFlushes = maxFlushes
+		self._cache = {}
+		self._enterClosure = frozenset(program.enterClosure)
+		self._startStates = frozenset(program.closures[AT_START][program.enter])
+		self.start = self._dfaState(self._startStates)
+
+	def __len__(self):
+		return len(self._cache)
+
+
+	def exhausted(self, generation):
+		'''
+		Whether the cache has been flushed too often since generation.
+		'''
+		return self._maxFlushes is not None and self.generation - generation > self._maxFlushes
+
+	def startAt(self, atStart):
+		'''
+		The start state, for starting at the beginning of the input or not.
+		'''
+		if atStart:
+			return self.start
+		return self._dfaState(self._enterClosure)
+
+	def transition(self, dstate, cls):
+		self.stats.misses += 1
+		program = self.program
+		conditionIds = program.conditionIds
+		satisfied = program.alphabet.classConditions[cls]
+		nextStates = set() if self.anchored else set(self._enterClosure)
+		for state in dstate.states:
+			if conditionIds[state] in satisfied:
+				nextStates.update(program.successors[state])
+		nextState = self._dfaState(frozenset(nextStates))
+		dstate.transitions[cls] = nextState
+		return nextState
+
+	def matchesAtEnd(self, dstate):
+		if dstate.matchesAtEnd is None:
+			closures = self.program.closures[AT_END]
+			dstate.matchesAtEnd = dstate.isMatch or any(self.program.exit in closures[state] for state in dstate.states)
+		return dstate.matchesAtEnd
+
+	def endTags(self, dstate):
+		if dstate.endTags is None:
+			closures = self.program.closures[AT_END]
+			dstate.endTags = self._tags(other for state in dstate.states for other in closures[state])
+		return dstate.endTags
+
+	def _dfaState(self, states):
+		cache = self._cache
+		dstate = cache.get(states)
+		if dstate is None:
+			if len(cache) >= self._maxStates:
+				cache = self._flush()
+			dstate = cache.setdefault(states, self._newDFAState(states))
+		return dstate
+
+	def _newDFAState(self, states):
+		return DFAState(states, self.program.exit in states, self._tags(states))
+
+	def _tags(self, states):
+		tags = self.program.tags
+		return frozenset(tags[state] for state in states if tags[state] is not None)
+
+	def _flush(self):
+		self.generation += 1
+		self.stats.flushes += 1
+		start = self._newDFAState(self._startStates)
+		cache = {self._startStates: start}
+		self.start = start
+		self._cache = cache
+		return cache
+
+
+class LazyDFAMatchTester:
+
+	'''
+	maxStates bounds the number of cached DFA states, and maxFlushes is the
+	number of times a single call to matches may flush the cache before it
+	falls back to NFA simulation. If matchStats is given, the work done
+	compiling and matching is counted in it.
+	'''
+
+	def __init__(self, regex, maxStates=10000, maxFlushes=3, asBytes=False, matchStats=None):
+		self._dfa = LazyDFA(genProgram(regex, asBytes, matchStats=matchStats), maxStates, maxFlushes)
+		self._matchStats = matchStats
+		if matchStats is not None:
+			matchStats.chars = 0
+			matchStats.cache = self._dfa.stats
+
+	@property
+	def stats(self):
+		return self._dfa.stats
+
+	@property
+	def cachedStates(self):
+		return len(self._dfa)
+
+	@property
+	def prefilter(self):
+		return self._dfa.program.prefilter
+
+
+	def matches(self, testStr):
+		prefilter = self._dfa.program.prefilter
+		if prefilter is not None:
+			if not prefilter.mayMatch(testStr):
+				return False
+			if prefilter.exact:
+				return True
+		dfa = self._dfa
+		stats = dfa.stats
+		generation = dfa.generation
+		misses = stats.misses
+		dstate = dfa.start
+		pos = 0
+		n = -1
+		try:
+			# pos + n ends up as the index of the last character consumed, so
+			# hits can be worked out afterwards instead of counted per character
+			for classes in dfa.program.alphabet.translateBlocks(testStr):
+				for n, cls in enumerate(classes):
+					if dstate.isMatch:
+						n -= 1
+						return True
+					try:
+						dstate = dstate.transitions[cls]
+					except KeyError:
+						dstate = dfa.transition(dstate, cls)
+						if dfa.exhausted(generation):
+							return self._fallback(dstate, testStr[pos + n + 1:])
+				pos += len(classes)
+				n = -1
+		finally:
+			stats.hits += pos + n + 1 - (stats.misses - misses)
+			if self._matchStats is not None:
+				self._matchStats.chars += pos + n + 1
+		return dfa.matchesAtEnd(dstate)
+
+	def _fallback(self, dstate, rest):
+		'''
+		Matches the rest of the input with NFA simulation, starting from the
+		NFA states in dstate.
+		'''
+		self.stats.fallbacks += 1
+		stream = MatchStream(self._dfa.program, dstate.states, self._matchStats)
+		stream.feed(rest)
+		return stream.finish()
+
+	def stream(self):
+		'''
+		Returns a new LazyDFAMatchStream, for matching input a piece at a
+		time. Streams share this match tester's DFA cache.
+		'''
+		return LazyDFAMatchStream(self._dfa, self._matchStats)
+
+
+class LazyDFAMatchStream:
+
+	'''
+	Tests whether input that arrives a piece at a time matches, keeping only
+	the current DFA state between pieces. If a single piece keeps flushing the
+	cache, the rest of the input is matched with a MatchStream, starting from
+	the NFA states in the current DFA state. The prefilter isn't used, since a
+	literal can be split between pieces. If matchStats is given, the stream
+	counts its work in it.
+	'''
+
+	def __init__(self, dfa, matchStats=None):
+		self._dfa = dfa
+		self._matchStats = matchStats
+		self.reset()
+
+
+	def reset(self):
+		self._dstate = self._dfa.start
+		self._fallback = None
+		self.matched = self._dstate.isMatch
+
+	def feed(self, chunk):
+		'''
+		Consumes the next piece of input, and returns whether there's been a
+		match yet.
+		'''
+		if self.matched:
+			return True
+		if self._fallback is not None:
+			self.matched = self._fallback.feed(chunk)
+			return self.matched
+
+		dfa = self._dfa
+		stats = dfa.stats
+		generation = dfa.generation
+		misses = stats.misses
+		dstate = self._dstate
+		pos = 0
+		n = -1
+		try:
+			for classes in dfa.program.alphabet.translateBlocks(chunk):
+				for n, cls in enumerate(classes):
+					try:
+						dstate = dstate.transitions[cls]
+					except KeyError:
+						dstate = dfa.transition(dstate, cls)
+						if dfa.exhausted(generation):
+							stats.fallbacks += 1
+							self._fallback = MatchStream(dfa.program, dstate.states, self._matchStats)
+							self.matched = self._fallback.feed(chunk[pos + n + 1:])
+							return self.matched
+					if dstate.isMatch:
+						self._dstate = dstate
+						self.matched = True
+						return True
+				pos += len(classes)
+				n = -1
+		finally:
+			stats.hits += pos + n + 1 - (stats.misses - misses)
+			if self._matchStats is not None:
+				self._matchStats.chars += pos + n + 1
+		self._dstate = dstate
+		self.matched = dstate.isMatch
+		return self.matched
+
+	def finish(self):
+		'''
+		Ends the input, and returns whether it matched. The stream is then
+		reset for the next input.
+		'''
+		if self.matched:
+			matched = True
+		elif self._fallback is not None:
+			matched = self._fallback.finish()
+		else:
+			matched = self._dfa.matchesAtEnd(self._dstate)
+		self.reset()
+		return matched
@@ -0,0 +1,95 @@
+import time
+from contextlib import contextmanager
+
+
+
+'''
+Counters for finding out which patterns are expensive. They're opt-in: a
+pattern only keeps MatchStats if it's compiled with stats turned on, and the
+engines check for them once per call (or per piece of a stream), not once per
+character, so patterns without them run just as fast as before. Patterns with
+them run the instrumented versions of the hot loops, which are slower.
+
+What's counted depends on the engine. Every engine counts calls, matches, and
+the characters it was given, and records how long each phase of compiling
+took. On top of that:
+
+nfa      - the characters consumed, the size of the fringe after each one
+           (its peak and average), and the closure steps, i.e. the states
+           added to the fringe from precomputed epsilon closures
+lazydfa  - the characters consumed, and the DFA cache's hits and misses. If
+           it falls back to NFA simulation, the fringe is counted from then on.
+
+The counters aren't locked, so a pattern shared by several threads can lose
+a few updates. They're for finding hot spots, not for accounting.
+'''
+
+
+class MatchStats:
+
+	'''
+	compileTimes maps each compile phase (named after the class that does it)
+	to the seconds it took. chars is None if the engine doesn't count the
+	characters it consumes, and cache is the lazy DFA's DFACacheStats, if
+	there is one.
+	'''
+
+	def __init__(self):
+		self.compileTimes = {}
+		self.calls = 0
+		self.matched = 0
+		self.inputChars = 0
+		self.chars = None
+		self.fringeSteps = 0
+		self.fringeTotal = 0
+		self.peakFringe = 0
+		self.closureSteps = 0
+		self.cache = None
+
+	@property
+	def averageFringe(self):
+		if self.fringeSteps == 0:
+			return 0.0
+		return self.fringeTotal / self.fringeSteps
+
+
+	def addFringe(self, size):
+		self.fringeSteps += 1
+		self.fringeTotal += size
+		if size > self.peakFringe:
+			self.peakFringe = size
+
+	def __str__(self):
+		lines = [
+			'calls                {}'.format(self.calls),
+			'matched              {}'.format(self.matched),
+			'input chars          {}'.format(self.inputChars),
+		]
+		if self.chars is not None:
+			lines.append('chars consumed       {}'.format(self.chars))
+		if self.fringeSteps > 0:
+			lines.append('peak fringe          {}'.format(self.peakFringe))
+			lines.append('average fringe       {:.2f}'.format(self.averageFringe))
+			lines.append('closure steps        {}'.format(self.closureSteps))
+		if self.cache is not None:
+			lines.append('cache hits           {}'.format(self.cache.hits))
+			lines.append('cache misses         {}'.format(self.cache.misses))
+			lines.append('cache flushes        {}'.format(self.cache.flushes))
+			lines.append('cache fallbacks      {}'.format(self.cache.fallbacks))
+		for phase, seconds in self.compileTimes.items():
+			lines.append('{:<20} {:.3f}ms'.format(phase, seconds * 1000))
+		return '\n'.join(lines)
+
+
+@contextmanager
+def timePhase(matchStats, phase):
+	'''
+	Records how long the with block takes as a compile phase of matchStats,
+	which can be None to not record anything.
+	'''
+	if matchStats is None:
+		yield
+		return
+	start = time.perf_counter()
+	yield
+	matchStats.compileTimes[phase] = matchStats.compileTimes.get(phase, 0.0) + time.perf_counter() - start
@@ -1,5 +1,4 @@
-from parser import Parser
-from statemachine import StateMachineBuilder
+from program import genProgram, AT_START, AT_END
 from collections import defaultdict
 
 
@@ -8,6 +7,9 @@ from collections import defaultdict
 The match tester operates on nondeterministic finte automaton (state machine)
 and uses it to test whether given strings match the associated regex. Basically,
 it's the part the actually tells you if regex matches a certain string.
+
+The state machine is run from a Program, which has the epsilon closure of each
+state worked out ahead of time, so a step is just a union of closures.
 '''
 
 
@@ -22,24 +24,20 @@ class MatchTesterFringe:
 	The MatchTester runs a nondeterministic finite automaton,
 	so the MatchTesterFringe contains all the states the we're in
 	at the same time.
+
+	States are kept by the id of their condition (see Program), so finding
+	the ones a character satisfies is a dict lookup for each of the
+	conditions its alphabet class satisfies.
 	'''
 
-	def __init__(self,  exit):
-		self._exit = exit
+	def __init__(self, program):
+		self._program = program
 		self.clear()
 
 	def clear(self):
-		self._unconditionals = set()
-		self._nonprinting = defaultdict(set)
+		self._nonprinting = []
 		self._normal = defaultdict(set)
 
-	def clearNonprinting(self):
-		self._nonprinting = defaultdict(set)
-
-
-	@property
-	def unconditionals(self):
-		return self._unconditionals
 
 	@property
 	def nonprinting(self):
@@ -51,73 +49,175 @@ class MatchTesterFringe:
 
 
 	def addState(self, state):
-		if state is self._exit:
-			raise MatchFound()
-		if state.isUnconditional():
-			self._unconditionals.add(state)
-		elif state.isNonPrinting:
-			self._nonprinting[state.condition].add(state)
-		else:
-			self._normal[state.condition].add(state)
+		self.addStates((state,))
 
 	def addStates(self, states):
-		for s in states:
-			self.addState(s)
+		program = self._program
+		exit = program.exit
+		nonprinting = program.nonprinting
+		conditionIds = program.conditionIds
+		normal = self._normal
+		for state in states:
+			if state == exit:
+				raise MatchFound()
+			if nonprinting[state]:
+				self._nonprinting.append(state)
+			else:
+				normal[conditionIds[state]].add(state)
 
+	def __len__(self):
+		return len(self._nonprinting) + sum(map(len, self._normal.values()))
 
-class MatchTester:
-	def __init__(self, regex):
-		ast = Parser(regex).parse()
-		self._enter, self._exit = StateMachineBuilder(ast).genStateMachine()
-		self._fringe = MatchTesterFringe(self._exit)
 
+class ProfiledFringe(MatchTesterFringe):
 
-	def matches(self, testStr):
+	'''
+	A MatchTesterFringe that counts closure steps in a MatchStats.
+	'''
+
+	def __init__(self, program, matchStats):
+		self._matchStats = matchStats
+		super().__init__(program)
+
+	def addStates(self, states):
+		self._matchStats.closureSteps += len(states)
+		super().addStates(states)
+
+
+class MatchStream:
+
+	'''
+	Tests whether input that arrives a piece at a time matches. Only the
+	fringe is kept between pieces, so memory use depends on the size of the
+	state machine, not the length of the input. The stream starts from the
+	given states, or from the beginning of the input if there aren't any.
+	If matchStats is given, the stream counts its work in it.
+	'''
+
+	def __init__(self, program, states=None, matchStats=None):
+		self._program = program
+		self._matchStats = matchStats
+		if matchStats is None:
+			self._fringe = MatchTesterFringe(program)
+		else:
+			self._fringe = ProfiledFringe(program, matchStats)
+		self.reset(states)
+
+
+	def reset(self, states=None):
+		self.matched = False
+		self._fringe.clear()
+		if states is None:
+			states = self._program.closures[AT_START][self._program.enter]
 		try:
-			self._reset()
-			self._consumeNonprinting('^')
-			for c in testStr:
-				self._fringe.addState(self._enter)
-				self._processUnconditionals()
-
-				self._consumeChar(c)
-			self._fringe.addState(self._enter)
-			self._processUnconditionals()
-
-			self._consumeNonprinting('$')
-			self._processUnconditionals()
+			self._fringe.addStates(states)
 		except MatchFound:
+			self.matched = True
+
+	def feed(self, chunk):
+		'''
+		Consumes the next piece of input, and returns whether there's been a
+		match yet.
+		'''
+		if self.matched:
 			return True
-		return False
+		if self._matchStats is not None:
+			return self._profiledFeed(chunk)
+		try:
+			for classes in self._program.alphabet.translateBlocks(chunk):
+				for cls in classes:
+					self._consumeClass(cls)
+					self._fringe.addStates(self._program.enterClosure)
+		except MatchFound:
+			self.matched = True
+		return self.matched
+
+	def _profiledFeed(self, chunk):
+		'''
+		feed, but counting the characters consumed and the fringe's size
+		after each one.
+		'''
+		matchStats = self._matchStats
+		fringe = self._fringe
+		try:
+			for classes in self._program.alphabet.translateBlocks(chunk):
+				for cls in classes:
+					matchStats.chars += 1
+					self._consumeClass(cls)
+					fringe.addStates(self._program.enterClosure)
+					matchStats.addFringe(len(fringe))
+		except MatchFound:
+			self.matched = True
+		return self.matched
+
+	def finish(self):
+		'''
+		Ends the input, and returns whether it matched. The stream is then
+		reset for the next input.
+		'''
+		matched = self.matched
+		if not matched:
+			try:
+				self._consumeAssertions(AT_END)
+			except MatchFound:
+				matched = True
+		self.reset()
+		return matched
+
+	def _consumeAssertions(self, flags):
+		nonprinting = self._fringe.nonprinting[:]
+		closures = self._program.closures[flags]
+		for state in nonprinting:
+			self._fringe.addStates(closures[state])
+
+	def _consumeClass(self, cls):
+		'''
+		Consumes a character of alphabet class cls.
+		'''
+		normal = self._fringe.normal
+		self._fringe.clear()
 
-	def _consumeNonprinting(self, npc):
-		nonprinting = self._fringe.nonprinting
-		self._fringe.clearNonprinting()
+		successors = self._program.successors
+		for conditionId in self._program.alphabet.classConditions[cls]:
+			if conditionId in normal:
+				for state in normal[conditionId]:
+					self._fringe.addStates(successors[state])
 
-		if npc in nonprinting:
-			for state in nonprinting[npc]:
-				self._fringe.addStates(state.connections)
 
-	def _consumeChar(self, c):
-		normal = self._fringe.normal
-		self._fringe.clear()
+class MatchTester:
 
-		if c in normal:
-			for state in normal[c]:
-				self._fringe.addStates(state.connections)
+	'''
+	Nothing in a MatchTester changes after it's built. Each call to matches
+	gets its own fringe, so one MatchTester can be used by many threads at
+	once. If matchStats is given, the work done compiling and matching is
+	counted in it.
+	'''
 
-	def _reset(self):
-		self._fringe.clear()
-		self._fringe.addState(self._enter)
-		self._processUnconditionals()
+	def __init__(self, regex, asBytes=False, matchStats=None):
+		self._program = genProgram(regex, asBytes, matchStats=matchStats)
+		self._matchStats = matchStats
+		if matchStats is not None:
+			matchStats.chars = 0
 
+	@property
+	def prefilter(self):
+		return self._program.prefilter
 
-	def _processUnconditionals(self):
-		toProcess = list(self._fringe.unconditionals)
-		while len(toProcess) > 0:
-			cur = toProcess.pop()
-			for adjacent in cur.connections:
-				self._fringe.addState(adjacent)
 
-				if adjacent.isUnconditional():
-					toProcess.append(adjacent)
+	def matches(self, testStr):
+		prefilter = self._program.prefilter
+		if prefilter is not None:
+			if not prefilter.mayMatch(testStr):
+				return False
+			if prefilter.exact:
+				return True
+		stream = MatchStream(self._program, matchStats=self._matchStats)
+		stream.feed(testStr)
+		return stream.finish()
+
+	def stream(self):
+		'''
+		Returns a new MatchStream, for matching input a piece at a time. The
+		prefilter isn't used, since a literal can be split between pieces.
+		'''
+		return MatchStream(self._program, matchStats=self._matchStats)
@@ -1,14 +1,29 @@
 from tokenizer import Tokenizer
-from abstract_syntax_tree import ASTNode, ConcatNode, AlternationNode, DuplicationNode, CharNode, AnchorNode
+from abstract_syntax_tree import ASTNode, ConcatNode, AlternationNode, DuplicationNode, RepetitionNode, CharNode, CharClassNode, AnchorNode, GroupNode, ExpandedSize
+
+
+# Counted repetitions are matched by writing out a copy of what's repeated for
+# each count, so a{1,1000} costs as much as 1000 a's. A regex with counted
+# repetitions can't be bigger than this once they're written out (see
+# ExpandedSize), which bounds the size of its Program (or Pike VM program).
+# When matching bytes, the size is counted in UTF-8 bytes, since that's what
+# gets built. Engines that build a DFA from the Program can still blow up, so
+# they have their own limits (see DFABuilder).
+MAX_EXPANDED_SIZE = 20000
 
 class ParseError(Exception):
 	pass
 
+class PatternTooLargeError(Exception):
+	pass
+
 
 class Parser:
 
 	'''
-	Parses a regular expression into an abstract syntax tree.
+	Parses a regular expression into an abstract syntax tree. asBytes says
+	whether the regex is going to match bytes, which only changes how its
+	size is counted.
 	'''
 
 
@@ -26,14 +41,22 @@ class Parser:
 	Alternation |
 	'''
 
-	def __init__(self, regex):
+	def __init__(self, regex, asBytes=False):
 		self.tokenizer = Tokenizer(regex)
+		self.asBytes = asBytes
+		self.numGroups = 0
+		self.numRepetitions = 0
 
 
 	def parse(self):
 		ast = self.parse_regex()
 		if not self.tokenizer.atEnd():
 			raise ParseError()
+		if self.numRepetitions > 0:
+			size = ExpandedSize(ast, self.asBytes).size()
+			if size > MAX_EXPANDED_SIZE:
+				unit = 'bytes' if self.asBytes else 'characters'
+				raise PatternTooLargeError('Counted repetitions expand the regex to {} {}, and the limit is {}'.format(size, unit, MAX_EXPANDED_SIZE))
 		return ast
 
 
@@ -86,33 +109,42 @@ class Parser:
 
 	def parse_alternationExprn(self):
 		''' alternationExprn: anchorExprn ('|' anchorExprn)* '''
-		left = self.parse_anchorExprn()
+		children = [self.parse_anchorExprn()]
 
 		while not self.tokenizer.atEnd() and self.tokenizer.cur().isSpecial() and self.tokenizer.cur().value == '|':
 			self.tokenizer.advance()
-			right = self.parse_anchorExprn()
-			left = AlternationNode(left, right)
+			children.append(self.parse_anchorExprn())
 
-		return left
+		if len(children) == 1:
+			return children[0]
+		return AlternationNode(children)
 
 	def parse_duplicationExprn(self):
-		''' duplicationExprn: groupExprn ('*'|'+'|'?')? '''
+		''' duplicationExprn: groupExprn ('*'|'+'|'?'|REPEAT)? '''
 		grpExprn = self.parse_groupExprn()
 
 		if not self.tokenizer.atEnd() and self.tokenizer.cur().isSpecial() and self.tokenizer.cur().value in ('*', '+', '?'):
 			op = self.tokenizer.advance()
 			return DuplicationNode(op, grpExprn)
+		if not self.tokenizer.atEnd() and self.tokenizer.cur().isRepeat():
+			low, high = self.tokenizer.advance().value
+			self.numRepetitions += 1
+			return RepetitionNode(low, high, grpExprn)
 		return grpExprn
 
 	def parse_groupExprn(self):
-		''' groupExprn: CHAR | '(' regex ')' '''
+		''' groupExprn: CHAR | CLASS | '(' regex ')' '''
 		if self.tokenizer.cur().isChar():
 			return CharNode(self.tokenizer.advance())
+		if self.tokenizer.cur().isClass():
+			return CharClassNode(self.tokenizer.advance().value)
 		if self.tokenizer.cur().value == '(':
 			self.tokenizer.advance()
+			self.numGroups += 1
+			index = self.numGroups
 			subRegex = self.parse_regex()
 			if self.tokenizer.cur().value != ')':
 				raise ParseError()
 			self.tokenizer.advance()
-			return  subRegex
+			return GroupNode(index, subRegex)
 		raise ParseError()
@@ -0,0 +1,255 @@
+from abstract_syntax_tree import ASTNodeVisitor, matchesOnlyEmpty
+from parser import Parser
+from prefilter import genPrefilter
+from charclass import utf8Sequences
+
+
+
+'''
+The Pike VM finds capture groups in linear time. The regex is compiled from
+its abstract syntax tree into a small instruction set, and the VM runs every
+thread of the program in lockstep over the input, one character at a time,
+like the other engines run the states of an NFA. Each thread carries its own
+capture slots, and since threads are kept in priority order and only the
+highest priority thread survives at each instruction, there are never more
+threads than instructions.
+
+Threads are prioritized the same way a backtracking engine would try them
+(left alternatives first, greedy repetition), so the captures are the same as
+Perl's or Python's. That makes it slower than the boolean engines, so it's
+only meant to be used when captures are needed.
+
+The exception is a loop whose body can match the empty string. A backtracking
+engine stops the loop after an empty iteration, but here an empty iteration
+gets back to an instruction that's already been added at that position, so
+that thread is dropped and the loop is never taken empty. The groups, and
+even the whole match, can come out differently, e.g. (b?|c)+ on 'bcx'
+matches 'bc' where Python's re matches 'b'.
+
+Instructions are tuples of an opcode and its arguments:
+
+CHAR c        consume c
+CLASS k       consume any character in the CharClass k
+SPLIT x y     continue at both x and y, preferring x
+JMP x         continue at x
+SAVE n        record the current position in capture slot n
+ASSERT c      only continue at the start ('^') or end ('$') of the input
+MATCH         the regex has matched
+'''
+
+
+CHAR = 'CHAR'
+CLASS = 'CLASS'
+SPLIT = 'SPLIT'
+JMP = 'JMP'
+SAVE = 'SAVE'
+ASSERT = 'ASSERT'
+MATCH = 'MATCH'
+
+
+class PikeVMCompiler(ASTNodeVisitor):
+
+	'''
+	Compiles an abstract syntax tree into a list of instructions. Group n
+	saves its start and end to slots 2n and 2n+1, and the whole match is
+	group 0.
+	'''
+
+	def __init__(self, ast, asBytes=False):
+		super().__init__()
+		self.ast = ast
+		self.asBytes = asBytes
+		self.instructions = []
+
+	def genInstructions(self):
+		self.instructions = []
+		self._emit(SAVE, 0)
+		self.visit(self.ast)
+		self._emit(SAVE, 1)
+		self._emit(MATCH)
+		return self.instructions
+
+
+	def _emit(self, *instruction):
+		self.instructions.append(instruction)
+		return len(self.instructions) - 1
+
+	def _patch(self, pc, *instruction):
+		self.instructions[pc] = instruction
+
+	def visit_ConcatNode(self, node):
+		for child in node.children:
+			self.visit(child)
+
+	def visit_AlternationNode(self, node):
+		self._emitAlternation(node.children, self.visit)
+
+	def _emitAlternation(self, alternatives, emitAlternative):
+		# each alternative but the last is tried before the ones after it
+		jmps = []
+		for alternative in alternatives[:-1]:
+			split = self._emit(None)
+			emitAlternative(alternative)
+			jmps.append(self._emit(None))
+			self._patch(split, SPLIT, split + 1, len(self.instructions))
+		emitAlternative(alternatives[-1])
+		for jmp in jmps:
+			self._patch(jmp, JMP, len(self.instructions))
+
+	def visit_DuplicationNode(self, node):
+		op = node.op.value
+		if op == '?':
+			split = self._emit(None)
+			self.visit(node.child)
+			self._patch(split, SPLIT, split + 1, len(self.instructions))
+		elif op == '+':
+			start = len(self.instructions)
+			self.visit(node.child)
+			self._emit(SPLIT, start, len(self.instructions) + 1)
+		elif op == '*':
+			self._emitStar(node.child)
+		else:
+			assert False
+
+	def _emitStar(self, child):
+		split = self._emit(None)
+		self.visit(child)
+		self._emit(JMP, split)
+		self._patch(split, SPLIT, split + 1, len(self.instructions))
+
+	def visit_RepetitionNode(self, node):
+		minCopies, maxCopies = node.min, node.max
+		if matchesOnlyEmpty(node.child):
+			# every copy would match in the same place, so one is enough
+			minCopies = min(node.min, 1)
+			maxCopies = 1 if node.max is None else min(node.max, 1)
+		for _ in range(minCopies):
+			self.visit(node.child)
+		if maxCopies is None:
+			self._emitStar(node.child)
+			return
+		# the optional copies are nested, i.e. skipping one skips the rest
+		splits = []
+		for _ in range(maxCopies - minCopies):
+			splits.append(self._emit(None))
+			self.visit(node.child)
+		for split in splits:
+			self._patch(split, SPLIT, split + 1, len(self.instructions))
+
+	def visit_CharNode(self, node):
+		if not self.asBytes:
+			self._emit(CHAR, node.char.value)
+			return
+		for byte in node.char.value.encode('utf-8'):
+			self._emit(CHAR, byte)
+
+	def visit_CharClassNode(self, node):
+		if not self.asBytes:
+			self._emit(CLASS, node.charClass)
+			return
+		sequences = utf8Sequences(node.charClass)
+		if len(sequences) == 0:
+			# nothing can match it
+			self._emit(CLASS, node.charClass)
+			return
+		self._emitAlternation(sequences, self._emitSequence)
+
+	def _emitSequence(self, byteClasses):
+		for byteClass in byteClasses:
+			self._emit(CLASS, byteClass)
+
+	def visit_AnchorNode(self, node):
+		if node.start:
+			self._emit(ASSERT, '^')
+		self.visit(node.child)
+		if node.end:
+			self._emit(ASSERT, '$')
+
+	def visit_GroupNode(self, node):
+		self._emit(SAVE, 2 * node.index)
+		self.visit(node.child)
+		self._emit(SAVE, 2 * node.index + 1)
+
+
+class PikeVM:
+	def __init__(self, regex, asBytes=False):
+		parser = Parser(regex, asBytes)
+		ast = parser.parse()
+		self.numGroups = parser.numGroups
+		self._instructions = PikeVMCompiler(ast, asBytes).genInstructions()
+		self._prefilter = genPrefilter(ast)
+		if self._prefilter is not None and asBytes:
+			self._prefilter = self._prefilter.encode()
+
+
+	def search(self, testStr):
+		'''
+		Finds the leftmost match, and returns the (start, end) of each group
+		in it (None for groups that didn't participate), starting with the
+		whole match as group 0. Returns None if there's no match.
+		'''
+		prefilter = self._prefilter
+		if prefilter is not None and not prefilter.mayMatch(testStr):
+			return None
+
+		numSlots = 2 * (self.numGroups + 1)
+		instructions = self._instructions
+		matched = None
+		threads = []
+		seen = set()
+		for pos in range(len(testStr) + 1):
+			if matched is None:
+				# start a new thread here, at the lowest priority
+				self._addThread(threads, seen, 0, [None] * numSlots, testStr, pos)
+
+			nextThreads = []
+			seen = set()
+			c = testStr[pos] if pos < len(testStr) else None
+			for pc, slots in threads:
+				instruction = instructions[pc]
+				if instruction[0] is MATCH:
+					# lower priority threads can't beat this one
+					matched = slots
+					break
+				if instruction[1] == c or (instruction[0] is CLASS and c is not None and c in instruction[1]):
+					self._addThread(nextThreads, seen, pc + 1, slots, testStr, pos + 1)
+			threads = nextThreads
+			if matched is not None and len(threads) == 0:
+				break
+
+		if matched is None:
+			return None
+		return [
+			(matched[2 * n], matched[2 * n + 1]) if matched[2 * n + 1] is not None else None
+			for n in range(self.numGroups + 1)
+		]
+
+	def _addThread(self, threads, seen, pc, slots, testStr, pos):
+		'''
+		Adds a thread at pc, following everything that doesn't consume a
+		character. seen stops lower priority threads from adding the same
+		instruction twice.
+		'''
+		toProcess = [(pc, slots)]
+		while len(toProcess) > 0:
+			pc, slots = toProcess.pop()
+			if pc in seen:
+				continue
+			seen.add(pc)
+			instruction = self._instructions[pc]
+			op = instruction[0]
+			if op is JMP:
+				toProcess.append((instruction[1], slots))
+			elif op is SPLIT:
+				# pushed in reverse so the preferred branch is processed first
+				toProcess.append((instruction[2], slots))
+				toProcess.append((instruction[1], slots))
+			elif op is SAVE:
+				slots = slots[:]
+				slots[instruction[1]] = pos
+				toProcess.append((pc + 1, slots))
+			elif op is ASSERT:
+				if (instruction[1] == '^' and pos == 0) or (instruction[1] == '$' and pos == len(testStr)):
+					toProcess.append((pc + 1, slots))
+			else:
+				threads.append((pc, slots))
@@ -0,0 +1,229 @@
+from abstract_syntax_tree import ConcatNode, AlternationNode, CharNode, GroupNode, ASTNodeVisitor
+from ahocorasick import AhoCorasick
+
+
+
+'''
+A prefilter is a cheap test that rules out most strings that can't match
+before any automaton gets run. It's a set of literals, at least one of which
+has to appear in any string the regex matches. For example, every match of
+'^.*ERROR(x|y)' contains 'ERRORx' or 'ERRORy'. Checking for them is done with
+str's substring search, which is far faster than stepping through the string a
+character at a time.
+
+The literals are found by walking the abstract syntax tree and working out,
+for each node, the exact set of strings it can match (if that's small), and
+a set of literals one of which must appear in anything it matches.
+
+When the whole regex is just an alternation of literals (e.g. 'foo|bar|baz')
+the prefilter is exact: a string matches if and only if it contains one of
+them, so there's no need to run an automaton at all. Large sets of literals
+are searched for with Aho-Corasick, rather than one at a time.
+'''
+
+
+MAX_LITERALS = 64
+MAX_SUBSTRING_SEARCHES = 32
+# bigger classes would multiply the literals around them, e.g. ERROR[0-9]
+# would need ten literals, where just ERROR does nearly as well
+MAX_CLASS_LITERALS = 4
+
+
+class Prefilter:
+	def __init__(self, literals, exact=False):
+		self.literals = tuple(sorted(literals))
+		self.exact = exact
+		self._ahoCorasick = None
+		if len(self.literals) > MAX_SUBSTRING_SEARCHES:
+			self._ahoCorasick = AhoCorasick(self.literals)
+
+	def mayMatch(self, testStr):
+		if self._ahoCorasick is not None:
+			return self._ahoCorasick.matches(testStr)
+		for literal in self.literals:
+			if literal in testStr:
+				return True
+		return False
+
+	def mayMatchRange(self, data, start, end):
+		'''
+		Like mayMatch, but checks data[start:end] without copying it out of
+		data, which can be bytes or an mmap.
+		'''
+		if self._ahoCorasick is not None:
+			with memoryview(data) as view:
+				return self._ahoCorasick.matches(view[start:end])
+		for literal in self.literals:
+			if data.find(literal, start, end) != -1:
+				return True
+		return False
+
+	def encode(self, encoding='utf-8'):
+		'''
+		The same prefilter, for searching bytes instead of strs.
+		'''
+		return Prefilter((literal.encode(encoding) for literal in self.literals), self.exact)
+
+	def __str__(self):
+		return 'Prefilter({})'.format(', '.join(map(repr, self.literals)))
+
+
+class LiteralInfo:
+
+	'''
+	What RequiredLiterals knows about a node. exact is the set of strings the
+	node matches, or None if there are too many. required is a set of
+	literals, one of which appears in every match, or None if there's nothing
+	useful to require.
+	'''
+
+	def __init__(self, exact, required=None):
+		self.exact = exact
+		self.required = bestLiterals([required, exact])
+
+
+def bestLiterals(candidates):
+	'''
+	Picks the set of literals that rules out the most strings: the one with
+	the longest shortest literal, and then the one with the fewest literals.
+	'''
+	best = None
+	for literals in candidates:
+		if literals is None or len(literals) > MAX_LITERALS or '' in literals:
+			continue
+		literals = removeRedundant(literals)
+		if best is None or (min(map(len, literals)), -len(literals)) > (min(map(len, best)), -len(best)):
+			best = literals
+	return best
+
+
+def removeRedundant(literals):
+	'''
+	If one literal contains another, finding the longer one is redundant.
+	'''
+	return frozenset(
+		literal for literal in literals
+		if not any(other != literal and other in literal for other in literals)
+	)
+
+
+class RequiredLiterals(ASTNodeVisitor):
+	def __init__(self, ast):
+		super().__init__()
+		self.ast = ast
+
+	def genLiterals(self):
+		return self.visit(self.ast).required
+
+
+	def visit_ConcatNode(self, node):
+		candidates = []
+		run = frozenset([''])
+		allExact = True
+		for child in node.children:
+			info = self.visit(child)
+			candidates.append(info.required)
+			if info.exact is None:
+				allExact = False
+				candidates.append(run)
+				run = None
+			elif run is None:
+				run = info.exact
+			elif len(run) * len(info.exact) > MAX_LITERALS:
+				allExact = False
+				candidates.append(run)
+				run = info.exact
+			else:
+				run = frozenset(a + b for a in run for b in info.exact)
+		candidates.append(run)
+		return LiteralInfo(run if allExact else None, bestLiterals(candidates))
+
+	def visit_AlternationNode(self, node):
+		children = [self.visit(child) for child in node.children]
+		exact = None
+		if all(child.exact is not None for child in children) and sum(len(child.exact) for child in children) <= MAX_LITERALS:
+			exact = frozenset().union(*(child.exact for child in children))
+		required = None
+		if all(child.required is not None for child in children):
+			required = frozenset().union(*(child.required for child in children))
+		return LiteralInfo(exact, required)
+
+	def visit_DuplicationNode(self, node):
+		child = self.visit(node.child)
+		op = node.op.value
+		if op == '?':
+			return LiteralInfo(None if child.exact is None else child.exact | {''})
+		elif op == '+':
+			return LiteralInfo(None, child.required)
+		elif op == '*':
+			return LiteralInfo(None)
+		assert False
+
+	def visit_RepetitionNode(self, node):
+		child = self.visit(node.child)
+		if child.exact == {''}:
+			# however many times it's repeated, it's still only ''
+			return child
+		if node.min == 0:
+			return LiteralInfo(None)
+		if node.max == node.min and child.exact is not None and len(child.exact) ** node.min <= MAX_LITERALS:
+			exact = frozenset([''])
+			for _ in range(node.min):
+				exact = frozenset(a + b for a in exact for b in child.exact)
+			return LiteralInfo(exact)
+		return LiteralInfo(None, child.required)
+
+	def visit_CharNode(self, node):
+		return LiteralInfo(frozenset([node.char.value]))
+
+	def visit_CharClassNode(self, node):
+		if len(node.charClass) > MAX_CLASS_LITERALS:
+			return LiteralInfo(None)
+		return LiteralInfo(frozenset(map(chr, node.charClass)))
+
+	def visit_AnchorNode(self, node):
+		child = self.visit(node.child)
+		return LiteralInfo(child.exact, child.required)
+
+	def visit_GroupNode(self, node):
+		return self.visit(node.child)
+
+
+def literalAlternatives(ast):
+	'''
+	If ast is nothing but an alternation of literals, returns the literals.
+	Otherwise returns None. Alternations can be nested in groups any number of
+	levels deep, so the tree is walked without recursion.
+	'''
+	literals = []
+	toProcess = [ast]
+	while len(toProcess) > 0:
+		cur = toProcess.pop()
+		if isinstance(cur, AlternationNode):
+			toProcess += reversed(cur.children)
+		elif isinstance(cur, GroupNode):
+			toProcess.append(cur.child)
+		elif isinstance(cur, CharNode):
+			literals.append(cur.char.value)
+		elif isinstance(cur, ConcatNode) and all(isinstance(child, CharNode) for child in cur.children):
+			literals.append(''.join(child.char.value for child in cur.children))
+		else:
+			return None
+	return literals
+
+
+def genPrefilter(ast):
+	'''
+	Returns a Prefilter for ast, or None if there aren't any literals worth
+	checking for.
+	'''
+	literals = literalAlternatives(ast)
+	if literals is not None and '' not in literals:
+		if len(literals) <= MAX_SUBSTRING_SEARCHES:
+			literals = removeRedundant(literals)
+		return Prefilter(set(literals), exact=True)
+
+	literals = RequiredLiterals(ast).genLiterals()
+	if literals is None:
+		return None
+	return Prefilter(literals)
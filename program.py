@@ -0,0 +1,193 @@
+from array import array
+
+from parser import Parser
+from statemachine import StateMachineBuilder, StateGraphOptimizer, reverseStateMachine
+from prefilter import genPrefilter
+from simplify import simplifyAST
+from alphabet import genAlphabet
+from matchstats import timePhase
+
+
+
+'''
+A Program is a state machine that's been prepared for matching. The states
+are numbered, and everything that can be worked out without looking at the
+input is worked out ahead of time. In particular, the epsilon closure of every
+state (everything reachable from it without consuming a character) is
+precomputed, so the match testers never have to walk the state graph.
+
+The non-printing states '^' and '$' are assertions: they're only passed
+through when the input is at its start or end. Closures are computed for each
+combination of assertions, and are indexed by the flags AT_START and AT_END.
+A closure keeps any '$' states it couldn't pass through, so they can be
+checked once the input runs out, but it drops the unconditional states in the
+middle since they've already been dealt with.
+
+A Program doesn't keep the State objects it was built from. States are just
+numbers, and what's known about them is kept in columns: flat arrays indexed
+by state. Lists of states per state (connections, closures and successors)
+are kept as StateLists, which pack all of the lists into one array.
+'''
+
+
+AT_START = 1
+AT_END = 2
+
+
+class StateLists:
+
+	'''
+	A list of lists of states, stored as one array of all the states, and an
+	array of where each list starts in it. lists[n] is a (read only) array of
+	the states in the nth list.
+	'''
+
+	def __init__(self, lists):
+		offsets = [0]
+		allStates = []
+		for states in lists:
+			allStates += states
+			offsets.append(len(allStates))
+		self._offsets = array('i', offsets)
+		self._states = array('i', allStates)
+
+	def __len__(self):
+		return len(self._offsets) - 1
+
+	def __getitem__(self, n):
+		return self._states[self._offsets[n]:self._offsets[n + 1]]
+
+	def __iter__(self):
+		for n in range(len(self)):
+			yield self[n]
+
+
+class Program:
+
+	'''
+	Per state, Program holds its condition (None if unconditional), whether
+	it's non-printing, and its connections. alphabet is the Alphabet of the
+	conditions that consume a character, and conditionIds[state] is the
+	index of the state's condition in alphabet.conditions (or -1 if it
+	doesn't consume one), so the states a character satisfies are the ones
+	whose conditionIds are in alphabet.classConditions for the character's
+	class. closures[flags][state] is the state's epsilon closure, and
+	successors[state] is everything the state leads to once its condition
+	has been consumed. prefilter, if there is one, rules out strings that
+	can't match before the states are run.
+
+	A Program built from several regexes has tagged exits instead of a
+	single exit, in which case exit is None and tags[state] says which regex
+	a state is the exit of.
+	'''
+
+	def __init__(self, enter, exit, prefilter=None):
+		states = self._numberStates(enter)
+		ids = {state: n for n, state in enumerate(states)}
+
+		self.prefilter = prefilter
+		self.enter = ids[enter]
+		self.exit = ids.get(exit)
+		self.tags = tuple(state.tag for state in states)
+		self.conditions = tuple(state.condition for state in states)
+		self.nonprinting = array('B', (state.isNonPrinting for state in states))
+		consuming = [
+			None if state.isNonPrinting else state.condition
+			for state in states
+		]
+		self.alphabet = genAlphabet(condition for condition in consuming if condition is not None)
+		conditionIds = {condition: n for n, condition in enumerate(self.alphabet.conditions)}
+		self.conditionIds = array('i', (-1 if condition is None else conditionIds[condition] for condition in consuming))
+		# worked out as lists, and only packed into columns at the end
+		connections = [[ids[other] for other in state.connections] for state in states]
+		closures = [
+			[self._genClosure(n, flags, connections) for n in range(len(states))]
+			for flags in range((AT_START | AT_END) + 1)
+		]
+		successors = [
+			self._union(closures[0][other] for other in connections[n])
+			for n in range(len(states))
+		]
+
+		self.connections = StateLists(connections)
+		self.closures = tuple(StateLists(flagClosures) for flagClosures in closures)
+		self.successors = StateLists(successors)
+		self.enterClosure = self.closures[0][self.enter]
+
+	def __len__(self):
+		return len(self.conditions)
+
+
+	def isSatisfied(self, state, flags):
+		'''
+		Whether an unconditional or non-printing state can be passed through.
+		'''
+		condition = self.conditions[state]
+		if condition is None:
+			return True
+		if not self.nonprinting[state]:
+			return False
+		return (condition == '^' and flags & AT_START) or (condition == '$' and flags & AT_END)
+
+	def _numberStates(self, enter):
+		states = []
+		seen = set()
+		toProcess = [enter]
+		while len(toProcess) > 0:
+			cur = toProcess.pop()
+			if cur in seen:
+				continue
+			seen.add(cur)
+			states.append(cur)
+			toProcess += reversed(cur.connections)
+		return states
+
+	def _genClosure(self, state, flags, connections):
+		toProcess = [state]
+		seen = set()
+		closure = []
+		while len(toProcess) > 0:
+			cur = toProcess.pop()
+			if cur in seen:
+				continue
+			seen.add(cur)
+			if self.isSatisfied(cur, flags) and cur != self.exit and self.tags[cur] is None:
+				toProcess += connections[cur]
+			elif self.conditions[cur] == '^' and self.nonprinting[cur]:
+				# can't be at the start any more, so it's a dead end
+				pass
+			else:
+				closure.append(cur)
+		return sorted(closure)
+
+	def _union(self, closures):
+		union = set()
+		for closure in closures:
+			union.update(closure)
+		return sorted(union)
+
+
+def genProgram(regex, asBytes=False, reverse=False, matchStats=None):
+	'''
+	Compiles regex into a Program. If asBytes is set, the Program matches
+	bytes (UTF-8 encoded) instead of strs. If reverse is set, the Program
+	matches the reverse of what regex matches, and has no prefilter. The time
+	each phase takes is recorded in matchStats, if it's given.
+	'''
+	with timePhase(matchStats, 'Tokenizer'):
+		parser = Parser(regex, asBytes)
+	with timePhase(matchStats, 'Parser'):
+		ast = parser.parse()
+	with timePhase(matchStats, 'ASTSimplifier'):
+		simplified = simplifyAST(ast)
+	with timePhase(matchStats, 'StateMachineBuilder'):
+		enter, exit = StateMachineBuilder(simplified, asBytes).genStateMachine(optimize=False)
+	with timePhase(matchStats, 'StateGraphOptimizer'):
+		enter, exit = StateGraphOptimizer(enter, exit).optimize()
+	with timePhase(matchStats, 'Program'):
+		if reverse:
+			return Program(*reverseStateMachine(enter, exit))
+		prefilter = genPrefilter(ast)
+		if prefilter is not None and asBytes:
+			prefilter = prefilter.encode()
+		return Program(enter, exit, prefilter)
@@ -0,0 +1,236 @@
+import threading
+from collections import OrderedDict
+
+from matchtester import MatchTester
+from lazydfa import LazyDFAMatchTester
+from dfa import DFAMatchTester
+from bitparallel import BitParallelMatchTester
+from codegen import CodegenMatchTester
+from regexset import RegexSet
+from spans import SpanSearcher
+from pikevm import PikeVM
+from serialize import dumpDFA, loadDFA
+from matchstats import MatchStats, timePhase
+
+
+
+'''
+The library interface to the regex engine. All of the engines agree on what
+matches, but they make different trade-offs between compile time, memory use,
+and matching speed:
+
+nfa         - simulates the state machine directly. Cheap to compile, slow to
+              run.
+lazydfa     - builds a DFA a piece at a time as the input needs it.
+dfa         - builds and minimizes the whole DFA up front, then just walks a
+              table. Best for fixed patterns that are run over lots of input.
+bitparallel - simulates the state machine with the active states packed into
+              an int. Never blows up like a DFA can, but its tables grow
+              with the square of the number of states, so it's for
+              patterns of up to a couple of thousand states.
+codegen     - builds the whole DFA like dfa does, then compiles it into Python
+              code. The fastest at matching, and the slowest to compile, so
+              it's for the few patterns that get run the most.
+
+RegexSet tests a string against many regexes at once, and reports which of
+them matched. SpanSearcher finds where the matches are. PikeVM also finds
+where each capture group matched, but it's slower, so only use it when the
+groups are needed.
+
+Compiling is expensive, so compile keeps a bounded cache of the patterns it
+has compiled (patternCache), and compiling the same regex again is just a
+lookup. match and search use the cache too, so they're fine to call with the
+same regex over and over.
+
+Patterns compiled with the dfa mode can be saved to a file with Pattern.dump,
+and loaded again with load, without being compiled again.
+
+To find out which patterns are expensive, compile them with stats set, and
+look at Pattern.stats (see matchstats.py). Patterns without stats don't pay
+for them.
+'''
+
+
+DEFAULT_CACHE_SIZE = 512
+
+
+ENGINES = {
+	'nfa': MatchTester,
+	'lazydfa': LazyDFAMatchTester,
+	'dfa': DFAMatchTester,
+	'bitparallel': BitParallelMatchTester,
+	'codegen': CodegenMatchTester,
+}
+
+
+class Pattern:
+
+	'''
+	A compiled regex. A Pattern never changes once it's compiled (apart from
+	the lazy DFA's cache, which only ever grows or gets swapped out whole), and
+	anything that changes during a match is created by the call, so one
+	Pattern can be shared by any number of threads or tasks without locks.
+
+	If stats is set, the Pattern counts the work it does in a MatchStats.
+	'''
+
+	def __init__(self, regex, mode='lazydfa', asBytes=False, matchtester=None, stats=False):
+		if mode not in ENGINES:
+			raise ValueError('Unknown mode: "' + mode + '"')
+		self._regex = regex
+		self._mode = mode
+		self._asBytes = asBytes
+		self._stats = MatchStats() if stats else None
+		if matchtester is None:
+			with timePhase(self._stats, 'total'):
+				matchtester = ENGINES[mode](regex, asBytes=asBytes, matchStats=self._stats)
+		self._matchtester = matchtester
+
+	@property
+	def regex(self):
+		return self._regex
+
+	@property
+	def mode(self):
+		return self._mode
+
+	@property
+	def asBytes(self):
+		return self._asBytes
+
+	@property
+	def prefilter(self):
+		return self._matchtester.prefilter
+
+	@property
+	def stats(self):
+		'''
+		The Pattern's MatchStats, or None if it wasn't compiled with stats.
+		'''
+		return self._stats
+
+
+	def matches(self, testStr):
+		if self._stats is None:
+			return self._matchtester.matches(testStr)
+		stats = self._stats
+		stats.calls += 1
+		stats.inputChars += len(testStr)
+		matched = self._matchtester.matches(testStr)
+		stats.matched += matched
+		return matched
+
+	def stream(self):
+		'''
+		Returns a new stream for matching input a piece at a time. Each
+		stream belongs to one caller, but they can all share the Pattern.
+		'''
+		return self._matchtester.stream()
+
+	def dump(self, fname):
+		'''
+		Saves the compiled pattern to fname, to be loaded later with load.
+		Only patterns compiled with the dfa mode can be saved, since the other
+		engines build their automata as they go.
+		'''
+		if self._mode != 'dfa':
+			raise ValueError('Only dfa mode patterns can be dumped, not "' + self._mode + '"')
+		dumpDFA(self._matchtester.dfa, self._regex, self._asBytes, fname)
+
+	def __repr__(self):
+		return 'Pattern({!r}, {!r}, asBytes={}, stats={})'.format(self._regex, self._mode, self._asBytes, self._stats is not None)
+
+
+class PatternCache:
+
+	'''
+	A cache of compiled patterns (or anything else built from a regex), which
+	throws out the least recently used one when it has more than maxSize. A
+	maxSize of 0 turns it off. hits and misses count the lookups that did and
+	didn't find what they were looking for.
+	'''
+
+	def __init__(self, maxSize=DEFAULT_CACHE_SIZE):
+		self.maxSize = maxSize
+		self.hits = 0
+		self.misses = 0
+		self._cache = OrderedDict()
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._cache)
+
+
+	def get(self, factory, *args, **kwargs):
+		'''
+		Returns factory(*args, **kwargs), building it only if it isn't cached.
+		'''
+		key = (factory, args, tuple(sorted(kwargs.items())))
+		with self._lock:
+			if key in self._cache:
+				self.hits += 1
+				self._cache.move_to_end(key)
+				return self._cache[key]
+			self.misses += 1
+
+		# built outside the lock, so a slow compile doesn't hold up other threads
+		value = factory(*args, **kwargs)
+		with self._lock:
+			self._cache[key] = value
+			self._evict()
+		return value
+
+	def resize(self, maxSize):
+		with self._lock:
+			self.maxSize = maxSize
+			self._evict()
+
+	def clear(self):
+		with self._lock:
+			self._cache.clear()
+			self.hits = 0
+			self.misses = 0
+
+	def _evict(self):
+		while len(self._cache) > self.maxSize:
+			self._cache.popitem(last=False)
+
+	def __str__(self):
+		return 'PatternCache(size={}, maxSize={}, hits={}, misses={})'.format(
+			len(self._cache), self.maxSize, self.hits, self.misses)
+
+
+patternCache = PatternCache()
+
+
+def compile(regex, mode='lazydfa', asBytes=False, stats=False):
+	'''
+	If asBytes is set, the Pattern matches UTF-8 encoded bytes instead of
+	strs. If stats is set, the Pattern keeps MatchStats, and it's cached
+	separately from the same Pattern without them.
+	'''
+	return patternCache.get(Pattern, regex, mode, asBytes, stats=stats)
+
+
+def load(fname):
+	'''
+	Loads a Pattern saved with Pattern.dump. The file is memory mapped, so
+	processes that load the same file share it.
+	'''
+	dfa, regex, asBytes = loadDFA(fname)
+	return Pattern(regex, 'dfa', asBytes, DFAMatchTester(regex, asBytes=asBytes, dfa=dfa))
+
+
+def match(regex, testStr, mode='lazydfa', asBytes=False):
+	'''
+	Whether regex matches anywhere in testStr.
+	'''
+	return compile(regex, mode, asBytes).matches(testStr)
+
+
+def search(regex, testStr, asBytes=False):
+	'''
+	Returns the (start, end) of the leftmost-longest match of regex in
+	testStr, or None.
+	'''
+	return patternCache.get(SpanSearcher, regex, asBytes=asBytes).search(testStr)
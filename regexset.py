@@ -0,0 +1,62 @@
+from parser import Parser
+from statemachine import State, StateMachineBuilder
+from program import Program
+from simplify import simplifyAST
+from lazydfa import LazyDFA
+
+
+
+'''
+A RegexSet tests a string against many regexes in a single pass. The state
+machines for all of the regexes are joined into one big alternation, and each
+regex's exit is tagged with its position in the set. While running the merged
+machine, any tagged exits that are reached tell us which regexes matched.
+
+The merged machine is run as a lazy DFA, so the cost per character doesn't
+depend on how many regexes are in the set once the cache has warmed up. Since
+a set can have an enormous number of DFA states, the cache is flushed as
+often as it needs to be rather than falling back to NFA simulation.
+'''
+
+
+def genSetStateMachine(regexes):
+	enter = State()
+	for tag, regex in enumerate(regexes):
+		ast = simplifyAST(Parser(regex).parse())
+		subEnter, subExit = StateMachineBuilder(ast).genStateMachine()
+		subExit.tag = tag
+		enter.connect(subEnter)
+	return enter
+
+
+class RegexSet:
+	def __init__(self, regexes, maxStates=10000):
+		self.regexes = tuple(regexes)
+		program = Program(genSetStateMachine(self.regexes), None)
+		self._dfa = LazyDFA(program, maxStates, maxFlushes=None)
+
+	def __len__(self):
+		return len(self.regexes)
+
+
+	def matches(self, testStr):
+		'''
+		Returns the indexes of the regexes that match testStr, in order.
+		'''
+		dfa = self._dfa
+		numRegexes = len(self.regexes)
+		matched = set()
+		dstate = dfa.start
+		for cls in dfa.program.alphabet.iterClasses(testStr):
+			if dstate.tags:
+				matched |= dstate.tags
+				if len(matched) == numRegexes:
+					break
+			try:
+				dstate = dstate.transitions[cls]
+			except KeyError:
+				dstate = dfa.transition(dstate, cls)
+		else:
+			matched |= dstate.tags
+			matched |= dfa.endTags(dstate)
+		return sorted(matched)
@@ -0,0 +1,135 @@
+import os
+import sys
+import mmap
+import struct
+from array import array
+
+from dfa import DFA
+from alphabet import Alphabet
+from prefilter import Prefilter
+
+
+
+'''
+Compiled DFAs can be saved to a file and loaded back without parsing the regex
+or building the DFA again. Loading memory maps the file, and the transition
+table is used straight out of the mapping, so any number of processes that
+load the same file share its pages instead of each having a copy.
+
+The file is a fixed size header, followed by sections which each start on an
+8 byte boundary. Everything is little endian.
+
+header      - see HEADER below
+table       - the DFA's transition table, one int32 per entry
+endAccepts  - one byte per table entry
+starts      - where each piece of the DFA's Alphabet starts, as int32s
+classes     - the class of each of those pieces, as int32s
+regex       - the regex, UTF-8 encoded
+prefilter   - the prefilter's literals, each an int32 length and its bytes
+              (UTF-8 encoded if the pattern matches strs)
+
+VERSION goes up whenever the format changes, and files from other versions are
+rejected rather than misread.
+'''
+
+
+MAGIC = b'PYRX'
+VERSION = 2
+HEADER = struct.Struct('<4sIIIiiIIII')
+ALIGNMENT = 8
+
+AS_BYTES = 1
+HAS_PREFILTER = 2
+PREFILTER_EXACT = 4
+
+
+class FormatError(Exception):
+	pass
+
+
+def dumpDFA(dfa, regex, asBytes, fname):
+	'''
+	Writes dfa, which was compiled from regex, to fname.
+	'''
+	starts = array('i', dfa.alphabet.starts)
+	classes = array('i', dfa.alphabet.classes)
+	table = array('i', dfa.table)
+	for column in (table, starts, classes):
+		if sys.byteorder != 'little':
+			column.byteswap()
+	encodedRegex = regex.encode('utf-8')
+
+	flags = AS_BYTES if asBytes else 0
+	literals = b''
+	if dfa.prefilter is not None:
+		flags |= HAS_PREFILTER
+		if dfa.prefilter.exact:
+			flags |= PREFILTER_EXACT
+		for literal in dfa.prefilter.literals:
+			if not asBytes:
+				literal = literal.encode('utf-8')
+			literals += struct.pack('<i', len(literal)) + literal
+
+	header = HEADER.pack(
+		MAGIC, VERSION, flags, dfa.numClasses, dfa.start, dfa.matchState,
+		len(table), len(starts), len(encodedRegex), len(literals))
+	with open(fname, 'wb') as f:
+		for section in (header, table, dfa.endAccepts, starts, classes, encodedRegex, literals):
+			f.write(section)
+			f.write(bytes(-f.tell() % ALIGNMENT))
+
+
+def loadDFA(fname):
+	'''
+	Returns (dfa, regex, asBytes) from a file written by dumpDFA.
+	'''
+	with open(fname, 'rb') as f:
+		if os.fstat(f.fileno()).st_size < HEADER.size:
+			raise FormatError('Not a compiled pattern: "' + fname + '"')
+		view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+	magic, version, flags, numClasses, start, matchState, tableLen, numPieces, regexLen, literalsLen = HEADER.unpack_from(view)
+	if magic != MAGIC:
+		raise FormatError('Not a compiled pattern: "' + fname + '"')
+	if version != VERSION:
+		raise FormatError('Unsupported compiled pattern version {}: "{}"'.format(version, fname))
+	asBytes = bool(flags & AS_BYTES)
+
+	sections = []
+	offset = 0
+	for size in (HEADER.size, 4 * tableLen, tableLen, 4 * numPieces, 4 * numPieces, regexLen, literalsLen):
+		if offset + size > len(view):
+			raise FormatError('Truncated compiled pattern: "' + fname + '"')
+		sections.append(view[offset:offset + size])
+		offset += size + (-size % ALIGNMENT)
+	_, table, endAccepts, starts, classes, encodedRegex, literals = sections
+	alphabet = Alphabet(_intColumn(starts), _intColumn(classes), numClasses)
+
+	prefilter = None
+	if flags & HAS_PREFILTER:
+		prefilter = Prefilter(_literals(literals, asBytes), exact=bool(flags & PREFILTER_EXACT))
+
+	dfa = DFA(alphabet, _intColumn(table), start, matchState, endAccepts, prefilter)
+	return dfa, str(encodedRegex, 'utf-8'), asBytes
+
+
+def _intColumn(section):
+	'''
+	A column of int32s, used in place if the byte order allows it.
+	'''
+	if sys.byteorder == 'little':
+		return section.cast('i')
+	column = array('i')
+	column.frombytes(section)
+	column.byteswap()
+	return column
+
+
+def _literals(section, asBytes):
+	literals = []
+	offset = 0
+	while offset < len(section):
+		size, = struct.unpack_from('<i', section, offset)
+		literal = bytes(section[offset + 4:offset + 4 + size])
+		literals.append(literal if asBytes else literal.decode('utf-8'))
+		offset += 4 + size
+	return literals
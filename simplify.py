@@ -0,0 +1,222 @@
+from collections import OrderedDict
+
+from abstract_syntax_tree import ASTNodeVisitor, ConcatNode, AlternationNode, DuplicationNode, RepetitionNode, CharNode, CharClassNode, AnchorNode, matchesOnlyEmpty
+from tokenizer import Token, SPECIAL
+from charclass import CharClass, charRange
+
+
+
+'''
+The parser builds the abstract syntax tree exactly as the regex was written,
+so redundancies in the regex end up as redundant states in the state machine
+(and more states in the fringe for every character). The ASTSimplifier
+rewrites the tree into a smaller one that matches exactly the same strings:
+
+- groups are dropped, since the state machine doesn't care about captures
+- concatenations and alternations nested in others are flattened into them,
+  and an alternative that appears more than once is only kept once
+- a quantifier on a quantifier is collapsed into one, e.g. (a*)*, (a?)* and
+  (a+)? all become a*, and (a+)+ becomes a+
+- alternatives that start with the same thing are merged, with the common
+  prefix factored out, e.g. abc|abd|x becomes ab(c|d)|x. This is done
+  recursively, so an alternation of words turns into a trie.
+- a suffix common to every alternative is factored out too, e.g. xab|yb
+  becomes (xa|y)b
+- alternatives that are single characters or character classes are merged
+  into one class, e.g. a|b|[x-z] becomes [abx-z]
+- counted repetitions that are the same as a quantifier become one, e.g.
+  a{0,} becomes a*, and a{1} becomes a, and repeating something that only
+  matches the empty string is the same as having it once, e.g. (^){1000}
+  becomes ^. The rest are left for the state machine builder to write out.
+
+The simplified tree is only for matching (i.e. for Programs). It loses the
+groups and reorders alternatives, so anything that reports captures, or
+cares which alternative matched first, works from the parser's tree.
+'''
+
+
+# the counted repetitions that are just quantifiers
+QUANTIFIERS = {(0, None): '*', (1, None): '+', (0, 1): '?'}
+
+
+class ASTSimplifier(ASTNodeVisitor):
+
+	'''
+	Returns a simplified copy of ast. The tree passed in isn't changed.
+	'''
+
+	def __init__(self, ast):
+		super().__init__()
+		self.ast = ast
+		self._keys = {}
+
+	def simplify(self):
+		return self.visit(self.ast)
+
+
+	def visit_ConcatNode(self, node):
+		items = []
+		for child in node.children:
+			items += _items(self.visit(child))
+		return _concat(items)
+
+	def visit_AlternationNode(self, node):
+		return self._alternation([_items(self.visit(child)) for child in node.children])
+
+	def visit_DuplicationNode(self, node):
+		return _duplication(node.op.value, self.visit(node.child))
+
+	def visit_RepetitionNode(self, node):
+		child = self.visit(node.child)
+		bounds = (node.min, node.max)
+		if bounds == (0, 0):
+			return _concat([])
+		if bounds == (1, 1):
+			return child
+		if bounds in QUANTIFIERS:
+			return _duplication(QUANTIFIERS[bounds], child)
+		if matchesOnlyEmpty(child):
+			return child if node.min > 0 else _duplication('?', child)
+		return RepetitionNode(node.min, node.max, child)
+
+	def visit_CharNode(self, node):
+		return node
+
+	def visit_CharClassNode(self, node):
+		return node
+
+	def visit_AnchorNode(self, node):
+		# a bare anchor (e.g. '^') anchors the empty string
+		child = self.visit(node.child) if node.child is not None else _concat([])
+		return AnchorNode(node.start, node.end, child)
+
+	def visit_GroupNode(self, node):
+		return self.visit(node.child)
+
+
+	def _alternation(self, alternatives):
+		'''
+		Builds the node for an alternation of alternatives, each given as a
+		list of the items that are concatenated to make it up.
+		'''
+		flattened = []
+		for items in alternatives:
+			if len(items) == 1 and isinstance(items[0], AlternationNode):
+				flattened += [_items(child) for child in items[0].children]
+			else:
+				flattened.append(items)
+
+		unique = OrderedDict()
+		for items in flattened:
+			unique.setdefault(self._seqKey(items), items)
+		alternatives = [items for items in unique.values() if len(items) > 0]
+		optional = len(alternatives) < len(unique)
+
+		if len(alternatives) == 0:
+			return _concat([])
+		node = self._factor(alternatives)
+		return _duplication('?', node) if optional else node
+
+	def _factor(self, alternatives):
+		'''
+		Factors the common prefixes and suffixes out of alternatives, none of
+		which are empty.
+		'''
+		byFirst = OrderedDict()
+		for items in alternatives:
+			byFirst.setdefault(self._key(items[0]), []).append(items)
+
+		factored = []
+		for group in byFirst.values():
+			if len(group) == 1:
+				factored.append(group[0])
+				continue
+			n = self._commonPrefix(group)
+			rest = self._alternation([items[n:] for items in group])
+			factored.append(group[0][:n] + _items(rest))
+
+		singles = [items for items in factored if len(items) == 1 and isinstance(items[0], (CharNode, CharClassNode))]
+		if len(singles) > 1:
+			merged = CharClass(interval for items in singles for interval in _charClass(items[0]).intervals)
+			factored = [[CharClassNode(merged)]] + [items for items in factored if not any(items is single for single in singles)]
+
+		if len(factored) == 1:
+			return _concat(factored[0])
+		n = self._commonPrefix([list(reversed(items)) for items in factored])
+		if n == 0:
+			return AlternationNode([_concat(items) for items in factored])
+		rest = self._alternation([items[:-n] for items in factored])
+		return _concat(_items(rest) + factored[0][-n:])
+
+	def _commonPrefix(self, alternatives):
+		n = 0
+		shortest = min(map(len, alternatives))
+		while n < shortest and all(self._key(items[n]) == self._key(alternatives[0][n]) for items in alternatives):
+			n += 1
+		return n
+
+	def _seqKey(self, items):
+		return tuple(self._key(item) for item in items)
+
+	def _key(self, node):
+		'''
+		A hashable description of node, which is equal for nodes that are
+		the same.
+		'''
+		cached = self._keys.get(id(node))
+		if cached is not None:
+			return cached[0]
+		if isinstance(node, ConcatNode):
+			key = ('cat', self._seqKey(node.children))
+		elif isinstance(node, AlternationNode):
+			key = ('alt', frozenset(self._key(child) for child in node.children))
+		elif isinstance(node, DuplicationNode):
+			key = ('dup', node.op.value, self._key(node.child))
+		elif isinstance(node, RepetitionNode):
+			key = ('rep', node.min, node.max, self._key(node.child))
+		elif isinstance(node, AnchorNode):
+			key = ('anchor', node.start, node.end, self._key(node.child))
+		elif isinstance(node, CharClassNode):
+			key = ('class', node.charClass.intervals)
+		else:
+			key = ('char', node.char.value)
+		# the node is kept alive with its key, so its id can't be reused
+		self._keys[id(node)] = (key, node)
+		return key
+
+
+def _items(node):
+	'''
+	The things node concatenates, i.e. node itself unless it's a concatenation.
+	'''
+	if isinstance(node, ConcatNode):
+		return list(node.children)
+	return [node]
+
+
+def _charClass(node):
+	if isinstance(node, CharClassNode):
+		return node.charClass
+	return charRange(node.char.value, node.char.value)
+
+
+def _concat(items):
+	if len(items) == 1:
+		return items[0]
+	return ConcatNode(items)
+
+
+def _duplication(op, child):
+	if isinstance(child, ConcatNode) and len(child.children) == 0:
+		return child
+	if isinstance(child, DuplicationNode):
+		# the same op twice is the same as once, and any other combination
+		# can match any number of times, including none
+		if child.op.value != op:
+			op = '*'
+		child = child.child
+	return DuplicationNode(Token(SPECIAL, op), child)
+
+
+def simplifyAST(ast):
+	return ASTSimplifier(ast).simplify()
@@ -0,0 +1,109 @@
+from program import genProgram
+from lazydfa import LazyDFA
+
+
+
+'''
+The SpanSearcher finds where matches are, not just whether there are any. It
+finds leftmost-longest matches: the match that starts earliest, and of those,
+the one that ends last. It never backtracks, so it takes linear time:
+
+1. A forward lazy DFA checks whether there's a match at all, stopping at the
+   first one it finds. Most strings stop here.
+2. A lazy DFA for the reversed state machine runs backwards over the whole
+   string, starting from the end. It's in a matching state exactly at the
+   positions where a match starts, which gives the start of every match.
+3. From the first start, an anchored forward lazy DFA runs until it can't
+   match any more, and the last position it matched at is the end.
+
+finditer then picks up from the end of each match, reusing the starts found
+in step 2.
+'''
+
+
+class SpanSearcher:
+	def __init__(self, regex, maxStates=10000, asBytes=False):
+		program = genProgram(regex, asBytes)
+		self._prefilter = program.prefilter
+		self._unanchored = LazyDFA(program, maxStates, maxFlushes=None)
+		self._anchored = LazyDFA(program, maxStates, maxFlushes=None, anchored=True)
+		self._reverse = LazyDFA(genProgram(regex, asBytes, reverse=True), maxStates, maxFlushes=None)
+
+
+	def search(self, testStr):
+		'''
+		Returns the (start, end) of the leftmost-longest match, or None.
+		'''
+		return next(self.finditer(testStr), None)
+
+	def finditer(self, testStr):
+		'''
+		Yields the (start, end) of each leftmost-longest, non-overlapping
+		match, from left to right.
+		'''
+		if not self._hasMatch(testStr):
+			return
+		starts = self._matchStarts(testStr)
+		pos = 0
+		while True:
+			start = starts.find(1, pos)
+			if start == -1:
+				return
+			end = self._matchEnd(testStr, start)
+			yield start, end
+			pos = end if end > start else end + 1
+
+	def _hasMatch(self, testStr):
+		prefilter = self._prefilter
+		if prefilter is not None and not prefilter.mayMatch(testStr):
+			return False
+		dfa = self._unanchored
+		dstate = dfa.start
+		for cls in dfa.program.alphabet.iterClasses(testStr):
+			if dstate.isMatch:
+				return True
+			try:
+				dstate = dstate.transitions[cls]
+			except KeyError:
+				dstate = dfa.transition(dstate, cls)
+		return dfa.matchesAtEnd(dstate)
+
+	def _matchStarts(self, testStr):
+		'''
+		Returns a bytearray with a 1 at each position a match starts.
+		'''
+		dfa = self._reverse
+		starts = bytearray(len(testStr) + 1)
+		pos = len(testStr)
+		dstate = dfa.start
+		for cls in dfa.program.alphabet.iterClasses(testStr[::-1]):
+			if dstate.isMatch:
+				starts[pos] = 1
+			try:
+				dstate = dstate.transitions[cls]
+			except KeyError:
+				dstate = dfa.transition(dstate, cls)
+			pos -= 1
+		# the start of the string is the end of the reversed string
+		starts[0] = dfa.matchesAtEnd(dstate)
+		return starts
+
+	def _matchEnd(self, testStr, start):
+		'''
+		Returns the end of the longest match starting at start.
+		'''
+		dfa = self._anchored
+		dstate = dfa.startAt(start == 0)
+		end = -1
+		for pos, cls in enumerate(dfa.program.alphabet.iterClasses(testStr, start), start):
+			if dstate.isMatch:
+				end = pos
+			elif len(dstate.states) == 0:
+				return end
+			try:
+				dstate = dstate.transitions[cls]
+			except KeyError:
+				dstate = dfa.transition(dstate, cls)
+		if dfa.matchesAtEnd(dstate):
+			end = len(testStr)
+		return end
@@ -2,6 +2,7 @@ import os
 
 from abstract_syntax_tree import ASTNodeVisitor
 from visitor import Visitor
+from charclass import utf8Sequences
 
 '''
 This file contains a StateMachineBuilder for generating state machines from
@@ -22,13 +23,22 @@ but that would add unnessesary boiler plate code without adding an functionality
 class State:
 
 	'''
-	States are the nodes making up a state machine graph.
+	States are the nodes making up a state machine graph. A state machine
+	that combines several regexes has one exit per regex, and each of those
+	is tagged with something identifying the regex.
+
+	States only exist while a state machine is being built and optimized
+	(Program doesn't keep them), but there are lots of them, so they use
+	__slots__ to keep them small.
 	'''
 
-	def __init__(self, condition=None, isNonPrinting=False):
+	__slots__ = ('condition', 'connections', 'isNonPrinting', 'tag')
+
+	def __init__(self, condition=None, isNonPrinting=False, tag=None):
 		self.condition = condition
 		self.connections = []
 		self.isNonPrinting = isNonPrinting
+		self.tag = tag
 
 	def connect(self, other):
 		self.connections.append(other)
@@ -62,6 +72,7 @@ class StateGraphOptimizer:
 
 	'''
 	Optimizes state machine graphs by removing redundant unconditional nodes.
+	Tagged nodes are exits, so they're never redundant.
 	'''
 
 	def __init__(self, enter, exit):
@@ -89,7 +100,7 @@ class StateGraphOptimizer:
 			if cur in seen:
 				continue
 			seen.add(cur)
-			if cur.isUnconditional() and cur is not self.exit:
+			if cur.isUnconditional() and cur is not self.exit and cur.tag is None:
 				toProcess += cur.connections
 			else:
 				newConnections.append(cur)
@@ -98,24 +109,65 @@ class StateGraphOptimizer:
 
 
 
+def reverseStateMachine(enter, exit):
+	'''
+	Builds a new state machine that matches the reverse of everything the
+	given one matches, by reversing all of the connections. The old exit
+	becomes the new enter, and since the start and end of the input swap
+	places, so do '^' and '$'.
+	'''
+	states = []
+	copies = {}
+	toProcess = [enter]
+	while len(toProcess) > 0:
+		cur = toProcess.pop()
+		if cur in copies:
+			continue
+		condition = cur.condition
+		if cur.isNonPrinting:
+			condition = {'^': '$', '$': '^'}[condition]
+		copies[cur] = State(condition, cur.isNonPrinting)
+		states.append(cur)
+		toProcess += cur.connections
+
+	for state in states:
+		for other in state.connections:
+			copies[other].connect(copies[state])
+
+	newExit = State()
+	copies[enter].connect(newExit)
+	return StateGraphOptimizer(copies[exit], newExit).optimize()
+
+
+
+
 class StateMachineBuilder(ASTNodeVisitor):
 
 	'''
 	Generates a state machine from an abstract syntax tree. In this
 	context a state machine is a graph of differnt State objects, and
 	is a nondeterministic finite automaton.
+
+	If asBytes is set, the state machine matches the UTF-8 encoding of the
+	regex instead, with a state for each byte. The conditions are then ints,
+	which is what iterating over bytes gives. A character class is a single
+	state (or a single int if it only has one character), except when
+	matching bytes, where it's an alternation of the UTF-8 sequences of its
+	characters, and each byte of a sequence is a class of byte values.
 	'''
 
-	def __init__(self, ast):
+	def __init__(self, ast, asBytes=False):
 		self.ast = ast
+		self.asBytes = asBytes
 
-	def genStateMachine(self):
+	def genStateMachine(self, optimize=True):
 		enter, exit = self.visit(self.ast)
 		newExit = State()
 		exit.connect(newExit)
 		exit = newExit
 
-		enter, exit = StateGraphOptimizer(enter, exit).optimize()
+		if optimize:
+			enter, exit = StateGraphOptimizer(enter, exit).optimize()
 		return enter, exit
 
 
@@ -134,15 +186,11 @@ class StateMachineBuilder(ASTNodeVisitor):
 
 
 	def visit_AlternationNode(self, node):
-		sub0_enter, sub0_exit = self.visit(node.left)
-		sub1_enter, sub1_exit = self.visit(node.right)
-
 		enter, exit = State(), State()
-		enter.connect(sub0_enter)
-		enter.connect(sub1_enter)
-
-		sub0_exit.connect(exit)
-		sub1_exit.connect(exit)
+		for child in node.children:
+			subEnter, subExit = self.visit(child)
+			enter.connect(subEnter)
+			subExit.connect(exit)
 
 		return enter, exit
 
@@ -169,9 +217,67 @@ class StateMachineBuilder(ASTNodeVisitor):
 		assert False
 
 
+	def visit_RepetitionNode(self, node):
+		'''
+		Writes out min copies of the child, then either a loop or the
+		max - min optional copies. Each optional copy can skip straight to
+		the end, rather than past just itself, so the copies are nested like
+		(x(x(x)?)?)? instead of x?x?x?, and no closure has more than two
+		states in it.
+		'''
+		enter = exit = State()
+		for _ in range(node.min):
+			childEnter, childExit = self.visit(node.child)
+			exit.connect(childEnter)
+			exit = childExit
+
+		if node.max is None:
+			childEnter, childExit = self.visit(node.child)
+			loop = State()
+			exit.connect(loop)
+			loop.connect(childEnter)
+			childExit.connect(loop)
+			return enter, loop
+
+		end = State()
+		for _ in range(node.max - node.min):
+			exit.connect(end)
+			childEnter, childExit = self.visit(node.child)
+			exit.connect(childEnter)
+			exit = childExit
+		exit.connect(end)
+		return enter, end
+
+
 	def visit_CharNode(self, node):
-		s = State(node.char.value)
-		return s, s
+		if not self.asBytes:
+			s = State(node.char.value)
+			return s, s
+
+		encoded = node.char.value.encode('utf-8')
+		enter = exit = State(encoded[0])
+		for byte in encoded[1:]:
+			s = State(byte)
+			exit.connect(s)
+			exit = s
+		return enter, exit
+
+
+	def visit_CharClassNode(self, node):
+		if not self.asBytes:
+			s = State(_classCondition(node.charClass, chr))
+			return s, s
+
+		enter, exit = State(), State()
+		for sequence in utf8Sequences(node.charClass):
+			seqEnter = seqExit = State(_classCondition(sequence[0], int))
+			for byteClass in sequence[1:]:
+				s = State(_classCondition(byteClass, int))
+				seqExit.connect(s)
+				seqExit = s
+			enter.connect(seqEnter)
+			seqExit.connect(exit)
+		return enter, exit
 
 
 	def visit_AnchorNode(self, node):
@@ -190,6 +296,20 @@ class StateMachineBuilder(ASTNodeVisitor):
 		return enter, exit
 
 
+	def visit_GroupNode(self, node):
+		return self.visit(node.child)
+
+
+def _classCondition(charClass, toCondition):
+	'''
+	A class of one character is just that character, which is cheaper to
+	test for.
+	'''
+	if len(charClass) == 1:
+		return toCondition(charClass.intervals[0][0])
+	return charClass
+
+
 ''' State Machine Dot Gen --------------------------- '''
 
 
@@ -222,7 +342,8 @@ digraph astgraph {
 		self.seen.add(node)
 
 		label = 'NP ' if node.isNonPrinting else ''
-		label += 'exit' if node is self.exit else node.condition if node.condition else ''
+		label += 'exit' if node is self.exit else str(node.condition).replace('\\', '\\\\').replace('"', '\\"') if node.condition else ''
+		label += ' ' + str(node.tag) if node.tag is not None else ''
 
 		s = '\tnode{} [label="{}"]\n'.format(
 				self.getNodeID(node),
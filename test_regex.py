@@ -1,8 +1,36 @@
+import os
+import asyncio
+import threading
+import tempfile
 import unittest
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from matchtester import MatchTester
+from lazydfa import LazyDFAMatchTester
+from dfa import DFAMatchTester, DFABuilder, DFASizeError
+from bitparallel import BitParallelMatchTester, BitParallelSizeError
+from codegen import CodegenMatchTester
+import pyregex
+from program import genProgram, AT_START, AT_END
+from parser import Parser, PatternTooLargeError, MAX_EXPANDED_SIZE
+from simplify import simplifyAST
+from abstract_syntax_tree import ConcatNode, AlternationNode, DuplicationNode, RepetitionNode, CharClassNode, AnchorNode, GroupNode
+from alphabet import genAlphabet
+from regexset import RegexSet
+from ahocorasick import AhoCorasick
+from spans import SpanSearcher
+from pikevm import PikeVM
+from filesearch import mmapSearch, splitFile, searchRange, parallelSearch
+from asyncsearch import searchStream
+from serialize import FormatError, VERSION
+from matchstats import MatchStats
+from benchmark import runAll, compareResults, genCorpus
+from charclass import CharClass, charRange, utf8Sequences, DOT
 
 
 class MatcherTest(unittest.TestCase):
+	matcherClass = MatchTester
+
 	def setUp(self):
 		pass
 
@@ -14,7 +42,7 @@ class MatcherTest(unittest.TestCase):
 		for regex, canidate, expectedRes in tests:
 			with self.subTest():
 				try:
-					matcher = MatchTester(regex)
+					matcher = self.matcherClass(regex)
 				except Exception as e:
 					self.fail('{}\n\t regex:	{}'.format(str(e), regex))
 				res = matcher.matches(canidate)
@@ -27,7 +55,7 @@ class MatcherTest(unittest.TestCase):
 			with self.subTest():
 				if regex != prev_regex:
 					try:
-						matcher = MatchTester(regex)
+						matcher = self.matcherClass(regex)
 					except Exception as e:
 						self.fail('{}\n\t regex:	{}'.format(str(e), regex))
 				prev_regex = regex
@@ -38,6 +66,660 @@ class MatcherTest(unittest.TestCase):
 				self.assertEqual(res, expectedRes, '\n\tregex:    {}\n\tcanidate: {}\n\texpected: {},\n\tactual:   {}'.format(regex, canidate, expectedRes, res))
 
 
+class LazyDFAMatcherTest(MatcherTest):
+	matcherClass = LazyDFAMatchTester
+
+class SmallCacheLazyDFAMatcherTest(MatcherTest):
+	matcherClass = partial(LazyDFAMatchTester, maxStates=2, maxFlushes=1)
+
+	def testStats(self):
+		matcher = LazyDFAMatchTester('ab*c', maxStates=2, maxFlushes=10)
+		self.assertTrue(matcher.matches('ababbc'))
+		self.assertGreater(matcher.stats.misses, 0)
+		self.assertGreater(matcher.stats.flushes, 0)
+		self.assertLessEqual(matcher.cachedStates, 2)
+		self.assertEqual(matcher.stats.hits + matcher.stats.misses, 6)
+		self.assertFalse(matcher.matches('a' + 'x' * 100))
+		self.assertEqual(matcher.stats.hits + matcher.stats.misses, 107)
+		self.assertEqual(matcher.stats.fallbacks, 0)
+
+	def testStreamFlushes(self):
+		# the cache is flushed partway through chunks, and between them
+		matcher = LazyDFAMatchTester('ab*c', maxStates=2, maxFlushes=10)
+		stream = matcher.stream()
+		self.assertFalse(stream.feed('xab'))
+		self.assertFalse(stream.feed('bbx'))
+		self.assertFalse(stream.feed('abb'))
+		self.assertTrue(stream.feed('bcx'))
+		self.assertTrue(stream.finish())
+		self.assertGreater(matcher.stats.flushes, 0)
+		self.assertEqual(matcher.stats.fallbacks, 0)
+		self.assertEqual(matcher.stats.hits + matcher.stats.misses, 11)
+
+	def testFallback(self):
+		matcher = LazyDFAMatchTester('(a|b)*abb(a|b)*c', maxStates=2, maxFlushes=0)
+		self.assertTrue(matcher.matches('abababbc'))
+		self.assertFalse(matcher.matches('ababbabaa'))
+		self.assertEqual(matcher.stats.fallbacks, 2)
+
+class DFAMatcherTest(MatcherTest):
+	matcherClass = DFAMatchTester
+
+	def testMinimized(self):
+		self.assertEqual(DFAMatchTester('abb').dfa.numStates, 4)
+		self.assertEqual(DFAMatchTester('(a|b)*abb').dfa.numStates, 4)
+		self.assertEqual(DFAMatchTester('a|b|c').dfa.numStates, 2)
+
+	def testMaxSubsetEntries(self):
+		# few DFA states, but each stands for lots of NFA states
+		program = genProgram('a{300}')
+		self.assertRaises(DFASizeError, DFABuilder(program, maxSubsetEntries=10000).genDFA)
+		self.assertEqual(DFABuilder(program, maxSubsetEntries=100000).genDFA().numStates, 301)
+		self.assertRaises(DFASizeError, pyregex.Pattern, 'a{19999}', 'dfa')
+
+	def testCompile(self):
+		for mode in pyregex.ENGINES:
+			with self.subTest(mode=mode):
+				self.assertTrue(pyregex.compile('ab+c', mode).matches('xabbbc'))
+		self.assertRaises(ValueError, pyregex.compile, 'a', 'bogus')
+
+
+class BitParallelMatcherTest(MatcherTest):
+	matcherClass = BitParallelMatchTester
+
+	def testManyStates(self):
+		regex = '|'.join('x{}y'.format(c) for c in 'abcdefghijklmnopqrstuvwxyz' * 4)
+		matcher = self.matcherClass(regex)
+		self.assertTrue(matcher.matches('--xzy--'))
+		self.assertFalse(matcher.matches('--xzzy--'))
+
+	def testMaxStates(self):
+		self.assertRaises(BitParallelSizeError, self.matcherClass, 'ab+cdef', maxStates=5)
+		self.assertTrue(self.matcherClass('ab+cdef', maxStates=10).matches('abbcdef'))
+
+class CodegenMatcherTest(MatcherTest):
+	matcherClass = CodegenMatchTester
+
+	def testSource(self):
+		source = CodegenMatchTester('^ab*c').source
+		self.assertIn('return True', source)
+		self.assertIn('return False', source)
+		# matches everything, so there's nothing to loop over
+		self.assertNotIn('for', CodegenMatchTester('a*').source)
+
+class PatternTest(unittest.TestCase):
+	def testThreads(self):
+		for mode in pyregex.ENGINES:
+			patterns = {regex: pyregex.compile(regex, mode) for regex, _, _ in tests}
+			with ThreadPoolExecutor(8) as executor:
+				results = list(executor.map(lambda test: patterns[test[0]].matches(test[1]), tests * 8))
+			with self.subTest(mode=mode):
+				self.assertEqual(results, [expectedRes for _, _, expectedRes in tests] * 8)
+
+	def testSmallCacheThreads(self):
+		# threads flush the cache out from under each other
+		matcher = LazyDFAMatchTester('(a|b)*abb(a|b)*c', maxStates=4, maxFlushes=1)
+		candidates = ['ab' * n + 'abbc' for n in range(200)] + ['ab' * n + 'abc' for n in range(200)]
+		with ThreadPoolExecutor(8) as executor:
+			results = list(executor.map(matcher.matches, candidates))
+		self.assertEqual(results, [True] * 200 + [False] * 200)
+
+	def testAttributes(self):
+		pattern = pyregex.compile('ab+', 'dfa', asBytes=True)
+		self.assertEqual((pattern.regex, pattern.mode, pattern.asBytes), ('ab+', 'dfa', True))
+		self.assertRaises(AttributeError, setattr, pattern, 'regex', 'c')
+
+	def testTooLarge(self):
+		self.assertRaises(PatternTooLargeError, pyregex.compile, 'a{%d}' % (MAX_EXPANDED_SIZE + 1))
+		self.assertRaises(PatternTooLargeError, pyregex.compile, '((ab){1000}){1000}')
+		self.assertTrue(pyregex.compile('^a{%d}$' % MAX_EXPANDED_SIZE).matches('a' * MAX_EXPANDED_SIZE))
+
+	def testTooLargeBytes(self):
+		# each . is 28 states when matching UTF-8
+		self.assertRaises(PatternTooLargeError, pyregex.compile, '.{2000}', asBytes=True)
+		self.assertRaises(PatternTooLargeError, PikeVM, '.{2000}', asBytes=True)
+		self.assertRaises(PatternTooLargeError, pyregex.compile, 'é{%d}' % (MAX_EXPANDED_SIZE // 2 + 1), asBytes=True)
+		self.assertTrue(pyregex.compile('.{2000}').matches('a' * 2000))
+		self.assertTrue(pyregex.compile('^é{%d}$' % (MAX_EXPANDED_SIZE // 2), asBytes=True).matches('é'.encode() * (MAX_EXPANDED_SIZE // 2)))
+
+	def testTooLargeEmpty(self):
+		# copies of something that matches nothing still count
+		for regex in ('(){1000000000}', '(^){100000}', '($){100000}', '(x{0}){1000000000}'):
+			for mode in pyregex.ENGINES:
+				with self.subTest(regex=regex, mode=mode):
+					self.assertRaises(PatternTooLargeError, pyregex.Pattern, regex, mode)
+			self.assertRaises(PatternTooLargeError, PikeVM, regex)
+
+	def testRepeatedEmpty(self):
+		# these are inside the budget, and only get written out once
+		self.assertIsInstance(simplifyAST(Parser('(^){10000}').parse()), AnchorNode)
+		self.assertIsInstance(simplifyAST(Parser('(){0,10000}').parse()), ConcatNode)
+		for regex, canidate, expected in [('(^){10000}a', 'ab', [(0, 1), (0, 0)]), ('a($){10000}', 'ba', [(1, 2), (2, 2)]), ('(){0,10000}a', 'ba', [(1, 2), (1, 1)])]:
+			for mode in pyregex.ENGINES:
+				with self.subTest(regex=regex, mode=mode):
+					self.assertTrue(pyregex.Pattern(regex, mode).matches(canidate))
+			self.assertEqual(PikeVM(regex).search(canidate), expected)
+
+class PatternCacheTest(unittest.TestCase):
+	def testCompile(self):
+		pyregex.patternCache.clear()
+		pattern = pyregex.compile('ab+')
+		self.assertIs(pyregex.compile('ab+'), pattern)
+		self.assertIsNot(pyregex.compile('ab+', 'dfa'), pattern)
+		self.assertIsNot(pyregex.compile('ab+', asBytes=True), pattern)
+		self.assertEqual((pyregex.patternCache.hits, pyregex.patternCache.misses), (1, 3))
+
+	def testEviction(self):
+		cache = pyregex.PatternCache(2)
+		a = cache.get(pyregex.Pattern, 'a')
+		b = cache.get(pyregex.Pattern, 'b')
+		self.assertIs(cache.get(pyregex.Pattern, 'a'), a)
+		cache.get(pyregex.Pattern, 'c')
+		self.assertEqual(len(cache), 2)
+		self.assertIs(cache.get(pyregex.Pattern, 'a'), a)
+		self.assertIsNot(cache.get(pyregex.Pattern, 'b'), b)
+		cache.resize(0)
+		self.assertEqual(len(cache), 0)
+		self.assertIsNot(cache.get(pyregex.Pattern, 'a'), a)
+		self.assertEqual(len(cache), 0)
+
+	def testMatchAndSearch(self):
+		self.assertTrue(pyregex.match('ab+', 'xabb'))
+		self.assertFalse(pyregex.match('ab+', 'xa', 'dfa'))
+		self.assertEqual(pyregex.search('ab+', 'xabb'), (1, 4))
+		self.assertEqual(pyregex.search('\u00e9', 'caf\u00e9'.encode(), asBytes=True), (3, 5))
+		self.assertIsNone(pyregex.search('ab+', 'xa'))
+
+class MatchStatsTest(unittest.TestCase):
+	def testDisabled(self):
+		pattern = pyregex.compile('ab+')
+		self.assertIsNone(pattern.stats)
+		self.assertIsNot(pyregex.compile('ab+', stats=True), pattern)
+		self.assertIsNotNone(pyregex.compile('ab+', stats=True).stats)
+
+	def testEngines(self):
+		for mode in pyregex.ENGINES:
+			pattern = pyregex.Pattern('a(b|c)*d', mode, stats=True)
+			results = [pattern.matches(s) for s in ('xabcd', 'abc', 'ad')]
+			with self.subTest(mode=mode):
+				self.assertEqual(results, [True, False, True])
+				stats = pattern.stats
+				self.assertEqual((stats.calls, stats.matched, stats.inputChars), (3, 2, 10))
+				for phase in ('Tokenizer', 'Parser', 'StateMachineBuilder', 'StateGraphOptimizer', 'total'):
+					self.assertIn(phase, stats.compileTimes)
+				self.assertIn('calls', str(stats))
+
+	def testNFA(self):
+		stats = MatchStats()
+		matcher = MatchTester('a(b|c)*d', matchStats=stats)
+		matcher.matches('xabcd')
+		self.assertEqual(stats.chars, 5)
+		self.assertEqual(stats.fringeSteps, 4)
+		self.assertEqual(stats.peakFringe, 3)
+		self.assertGreater(stats.closureSteps, 0)
+
+	def testLazyDFA(self):
+		pattern = pyregex.Pattern('a(b|c)*d', 'lazydfa', stats=True)
+		pattern.matches('xabcd')
+		pattern.matches('xabcd')
+		self.assertEqual(pattern.stats.chars, 10)
+		# b and c are in the same alphabet class, so only the first of them misses
+		self.assertEqual((pattern.stats.cache.hits, pattern.stats.cache.misses), (6, 4))
+		self.assertEqual(pattern.stats.fringeSteps, 0)
+
+		# the NFA's fringe is counted once it falls back
+		stats = MatchStats()
+		matcher = LazyDFAMatchTester('(a|b)*abb(a|b)*c', maxStates=2, maxFlushes=0, matchStats=stats)
+		self.assertTrue(matcher.matches('ab' * 20 + 'abbc'))
+		self.assertEqual(matcher.stats.fallbacks, 1)
+		self.assertEqual(stats.chars, 44)
+		self.assertGreater(stats.fringeSteps, 0)
+
+class SerializeTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.TemporaryDirectory()
+		self.fname = os.path.join(self.dir.name, 'pattern.pyrx')
+
+	def tearDown(self):
+		self.dir.cleanup()
+
+	def testRoundTrip(self):
+		for asBytes in (False, True):
+			for regex, canidate, expectedRes in tests + unicodeTests:
+				with self.subTest(regex=regex, canidate=canidate, asBytes=asBytes):
+					pyregex.Pattern(regex, 'dfa', asBytes).dump(self.fname)
+					pattern = pyregex.load(self.fname)
+					self.assertEqual((pattern.regex, pattern.mode, pattern.asBytes), (regex, 'dfa', asBytes))
+					self.assertEqual(pattern.matches(canidate.encode() if asBytes else canidate), expectedRes)
+
+	def testPrefilter(self):
+		pyregex.Pattern('foo|b\u00e4r', 'dfa', asBytes=True).dump(self.fname)
+		prefilter = pyregex.load(self.fname).prefilter
+		self.assertEqual(prefilter.literals, (b'b\xc3\xa4r', b'foo'))
+		self.assertTrue(prefilter.exact)
+
+	def testBadFiles(self):
+		self.assertRaises(ValueError, pyregex.Pattern('a').dump, self.fname)
+		pyregex.Pattern('ab*', 'dfa').dump(self.fname)
+		with open(self.fname, 'r+b') as f:
+			data = f.read()
+			f.seek(4)
+			f.write((VERSION + 1).to_bytes(4, 'little'))
+		self.assertRaises(FormatError, pyregex.load, self.fname)
+		with open(self.fname, 'wb') as f:
+			f.write(b'not a pattern' * 10)
+		self.assertRaises(FormatError, pyregex.load, self.fname)
+		with open(self.fname, 'wb') as f:
+			f.write(data[:len(data) // 2])
+		self.assertRaises(FormatError, pyregex.load, self.fname)
+
+class MatchStreamTest(unittest.TestCase):
+	def testChunks(self):
+		matcherClasses = (MatchTester, LazyDFAMatchTester, partial(LazyDFAMatchTester, maxStates=2, maxFlushes=0),
+			DFAMatchTester, BitParallelMatchTester, CodegenMatchTester)
+		for matcherClass in matcherClasses:
+			for regex, canidate, expectedRes in tests:
+				stream = matcherClass(regex).stream()
+				for chunkSize in (1, 2, 5):
+					with self.subTest(matcherClass=matcherClass, regex=regex, canidate=canidate, chunkSize=chunkSize):
+						for i in range(0, len(canidate), chunkSize):
+							stream.feed(canidate[i:i + chunkSize])
+						self.assertEqual(stream.finish(), expectedRes)
+
+	def testAnchors(self):
+		stream = LazyDFAMatchTester('^ab$').stream()
+		self.assertTrue(stream.feed('') or stream.feed('a') or stream.feed('b') or stream.finish())
+		stream.feed('a')
+		stream.feed('b')
+		stream.feed('')
+		stream.feed('c')
+		self.assertFalse(stream.finish())
+
+	def testPatterns(self):
+		for mode in pyregex.ENGINES:
+			for regex in ('car|boat', 'ca+r|boat'):
+				with self.subTest(mode=mode, regex=regex):
+					stream = pyregex.compile(regex, mode).stream()
+					self.assertFalse(stream.feed('a bo'))
+					self.assertTrue(stream.feed('at'))
+					self.assertTrue(stream.finish())
+					self.assertFalse(stream.feed('a bot'))
+					self.assertFalse(stream.finish())
+
+	def testFallback(self):
+		matcher = LazyDFAMatchTester('(a|b)*abb(a|b)*c', maxStates=2, maxFlushes=0)
+		stream = matcher.stream()
+		self.assertFalse(stream.feed('abab'))
+		self.assertFalse(stream.feed('ba'))
+		self.assertTrue(stream.feed('c'))
+		self.assertTrue(stream.finish())
+		self.assertGreater(matcher.stats.fallbacks, 0)
+
+class BytesMatcherTest(unittest.TestCase):
+	def testMatches(self):
+		for mode in pyregex.ENGINES:
+			for regex, canidate, expectedRes in tests + unicodeTests:
+				with self.subTest(mode=mode, regex=regex, canidate=canidate):
+					matcher = pyregex.compile(regex, mode, asBytes=True)
+					self.assertEqual(matcher.matches(canidate.encode()), expectedRes)
+
+	def testMayMatchRange(self):
+		data = b'caf\xc3\xa9 ERROR\nok'
+		prefilter = pyregex.compile('ERROR|\u00e9', asBytes=True).prefilter
+		self.assertTrue(prefilter.mayMatchRange(data, 0, 10))
+		self.assertFalse(prefilter.mayMatchRange(data, 10, len(data)))
+
+class SpanSearcherTest(unittest.TestCase):
+	def testFinditer(self):
+		for regex, canidate, expected in spanTests:
+			with self.subTest(regex=regex, canidate=canidate):
+				self.assertEqual(list(SpanSearcher(regex).finditer(canidate)), expected)
+
+	def testSearch(self):
+		searcher = SpanSearcher('ab|abcd')
+		self.assertEqual(searcher.search('xabcde'), (1, 5))
+		self.assertIsNone(searcher.search('xacd'))
+		self.assertEqual(SpanSearcher('\u00e9+', asBytes=True).search('caf\u00e9\u00e9'.encode()), (3, 7))
+
+	def testAgreesWithMatches(self):
+		for regex, canidate, expectedRes in tests:
+			with self.subTest(regex=regex, canidate=canidate):
+				self.assertEqual(SpanSearcher(regex).search(canidate) is not None, expectedRes)
+
+class PikeVMTest(unittest.TestCase):
+	def testCaptures(self):
+		for regex, canidate, expected in captureTests:
+			with self.subTest(regex=regex, canidate=canidate):
+				self.assertEqual(PikeVM(regex).search(canidate), expected)
+
+	def testAgreesWithMatches(self):
+		for regex, canidate, expectedRes in tests:
+			with self.subTest(regex=regex, canidate=canidate):
+				self.assertEqual(PikeVM(regex).search(canidate) is not None, expectedRes)
+
+	def testBytes(self):
+		vm = PikeVM('caf(\u00e9+)', asBytes=True)
+		self.assertEqual(vm.search('un caf\u00e9\u00e9'.encode()), [(3, 10), (6, 10)])
+
+	def testEmptyLoops(self):
+		# unlike Python's re, loops never take an empty iteration (see pikevm.py)
+		self.assertEqual(PikeVM('(b?|c)+').search('bcx'), [(0, 2), (1, 2)])
+		self.assertEqual(PikeVM('(a*)*').search('b'), [(0, 0), None])
+
+class FileSearchTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.TemporaryDirectory()
+		self.lines = ['line {} {}'.format(n, 'ERROR' if n % 7 == 0 else 'ok') for n in range(1, 200)]
+		self.fname = os.path.join(self.dir.name, 'log.txt')
+		with open(self.fname, 'w') as f:
+			f.write('\n'.join(self.lines))
+
+	def tearDown(self):
+		self.dir.cleanup()
+
+	def expected(self):
+		return [(n, ln) for n, ln in enumerate(self.lines, 1) if 'ERROR' in ln]
+
+	def fifo(self, copies=1):
+		'''
+		Makes a FIFO that the file is written to (copies times) once it's
+		opened, which has no size and can't be memory mapped.
+		'''
+		fname = os.path.join(self.dir.name, 'fifo{}'.format(copies))
+		os.mkfifo(fname)
+		def write():
+			with open(fname, 'w') as f:
+				for _ in range(copies):
+					f.write('\n'.join(self.lines) + '\n')
+		writer = threading.Thread(target=write)
+		writer.start()
+		self.addCleanup(writer.join)
+		return fname
+
+	def testMmapSearch(self):
+		matches = []
+		matchtester = pyregex.compile('ERR(O|X)R', asBytes=True)
+		numLines = mmapSearch(matchtester, self.fname, lambda n, ln: matches.append((n, ln.decode())))
+		self.assertEqual(numLines, len(self.lines))
+		self.assertEqual(matches, self.expected())
+
+	@unittest.skipUnless(hasattr(os, 'mkfifo'), 'needs FIFOs')
+	def testMmapSearchFIFO(self):
+		matches = []
+		matchtester = pyregex.compile('ERR(O|X)R', asBytes=True)
+		numLines = mmapSearch(matchtester, self.fifo(), lambda n, ln: matches.append((n, ln.decode())))
+		self.assertEqual(numLines, len(self.lines))
+		self.assertEqual(matches, self.expected())
+
+	def testSplitFile(self):
+		with open(self.fname, 'rb') as f:
+			data = f.read()
+		chunks = splitFile(self.fname, 100)
+		self.assertEqual(chunks[0][0], 0)
+		self.assertEqual(chunks[-1][1], len(data))
+		matchtester = pyregex.compile('ERROR', asBytes=True)
+		matches = []
+		lineOffset = 0
+		for (start, end), (nextStart, _) in zip(chunks, chunks[1:] + [(len(data), None)]):
+			self.assertEqual(end, nextStart)
+			self.assertTrue(end == len(data) or data[end - 1:end] == b'\n')
+			lineOffset += searchRange(matchtester, data, start, end, lambda n, ln: matches.append((lineOffset + n, ln.decode())))
+		self.assertEqual(matches, self.expected())
+
+	def testParallelSearch(self):
+		matches = list(parallelSearch('ERROR', 'dfa', [self.fname, self.fname], 2))
+		expected = [(self.fname, n, ln) for n, ln in self.expected()]
+		self.assertEqual(matches, expected + expected)
+
+	@unittest.skipUnless(hasattr(os, 'mkfifo'), 'needs FIFOs')
+	def testParallelSearchFIFO(self):
+		fifo = self.fifo(2)
+		self.assertRaises(ValueError, splitFile, os.devnull, 100)
+		matches = list(parallelSearch('ERROR', 'dfa', [self.fname, fifo, self.fname], 2))
+		expected = self.expected()
+		secondCopy = [(n + len(self.lines), ln) for n, ln in expected]
+		self.assertEqual(matches,
+			[(self.fname, n, ln) for n, ln in expected] +
+			[(fifo, n, ln) for n, ln in expected + secondCopy] +
+			[(self.fname, n, ln) for n, ln in expected])
+
+class AsyncSearchTest(unittest.TestCase):
+	lines = ['line {} {}'.format(n, 'ERROR' if n % 7 == 0 else 'ok') for n in range(1, 200)]
+	expected = [(n, ln.encode()) for n, ln in enumerate(lines, 1) if 'ERROR' in ln]
+
+	async def search(self, pattern, data, **kwargs):
+		reader = asyncio.StreamReader()
+		reader.feed_data(data)
+		reader.feed_eof()
+		return [match async for match in searchStream(reader, pattern, **kwargs)]
+
+	def testSearchStream(self):
+		data = '\n'.join(self.lines).encode()
+		for chunkSize in (1, 7, 1 << 16):
+			with self.subTest(chunkSize=chunkSize):
+				matches = asyncio.run(self.search('ERR(O|X)R', data, chunkSize=chunkSize, yieldEvery=16))
+				self.assertEqual(matches, self.expected)
+		self.assertEqual(asyncio.run(self.search('^$', b'a\n\nb\n')), [(2, b'')])
+
+	def testSharedPattern(self):
+		matchtester = pyregex.compile('ERROR', asBytes=True)
+		data = '\n'.join(self.lines).encode()
+		async def searchAll():
+			return await asyncio.gather(*(self.search(matchtester, data, chunkSize=10, yieldEvery=16) for _ in range(4)))
+		self.assertEqual(asyncio.run(searchAll()), [self.expected] * 4)
+
+	def testModes(self):
+		data = '\n'.join(self.lines).encode()
+		for mode in pyregex.ENGINES:
+			with self.subTest(mode=mode):
+				pattern = pyregex.compile('ERR(O|X)R', mode, asBytes=True)
+				self.assertEqual(asyncio.run(self.search(pattern, data, chunkSize=10)), self.expected)
+
+class RegexSetTest(unittest.TestCase):
+	def testMatches(self):
+		regexes = sorted(set(regex for regex, _, _ in tests))
+		regexSet = RegexSet(regexes)
+		matchers = [MatchTester(regex) for regex in regexes]
+		for canidate in sorted(set(canidate for _, canidate, _ in tests)):
+			with self.subTest(canidate=canidate):
+				expected = [n for n, matcher in enumerate(matchers) if matcher.matches(canidate)]
+				self.assertEqual(regexSet.matches(canidate), expected)
+
+	def testSmallCache(self):
+		regexSet = RegexSet(['abc', '^x', 'y$', 'a|q'], maxStates=2)
+		self.assertEqual(regexSet.matches('xabc'), [0, 1, 3])
+		self.assertEqual(regexSet.matches('qy'), [2, 3])
+		self.assertEqual(regexSet.matches('yx'), [])
+
+class PrefilterTest(unittest.TestCase):
+	def literals(self, regex):
+		prefilter = genProgram(regex).prefilter
+		return None if prefilter is None else set(prefilter.literals)
+
+	def testLiterals(self):
+		self.assertEqual(self.literals('^a*ERROR(x|y)'), {'ERRORx', 'ERRORy'})
+		self.assertEqual(self.literals('ab*cde'), {'cde'})
+		self.assertEqual(self.literals('(abc)+d?'), {'abc'})
+		self.assertEqual(self.literals('car|boat|jet'), {'car', 'boat', 'jet'})
+		self.assertEqual(self.literals('a|ab'), {'a'})
+		self.assertIsNone(self.literals('a*'))
+		self.assertIsNone(self.literals('a|b*'))
+		self.assertIsNone(self.literals('(abc)?'))
+		self.assertIsNone(self.literals('^$'))
+		self.assertEqual(self.literals('x(ab){2}'), {'xabab'})
+		self.assertEqual(self.literals('(abc){2,5}'), {'abc'})
+		self.assertIsNone(self.literals('(abc){0,5}'))
+
+	def testExact(self):
+		self.assertTrue(genProgram('car|boat|jet').prefilter.exact)
+		self.assertFalse(genProgram('car|boat|jet*').prefilter.exact)
+		self.assertFalse(genProgram('^car|boat').prefilter.exact)
+		self.assertIsNone(genProgram('car|').prefilter)
+
+	def testExactSkipsAutomata(self):
+		# the automata would be too big to build, but they're never needed
+		for matcherClass in (DFAMatchTester, CodegenMatchTester, BitParallelMatchTester):
+			with self.subTest(matcherClass=matcherClass):
+				matcher = matcherClass('car|boat|jet', maxStates=1)
+				self.assertTrue(matcher.matches('a boat'))
+				self.assertFalse(matcher.matches('a bot'))
+		self.assertIsNone(CodegenMatchTester('car|boat').source)
+
+	def testMayMatch(self):
+		prefilter = genProgram('x(ab|cd)').prefilter
+		self.assertTrue(prefilter.mayMatch('--xcd--'))
+		self.assertFalse(prefilter.mayMatch('--xc-d--'))
+		self.assertTrue(prefilter.encode().mayMatch(b'--xab--'))
+
+class AhoCorasickTest(unittest.TestCase):
+	def testMatches(self):
+		ahoCorasick = AhoCorasick(['he', 'she', 'his', 'hers'])
+		self.assertTrue(ahoCorasick.matches('ushers'))
+		self.assertTrue(ahoCorasick.matches('ahis'))
+		self.assertFalse(ahoCorasick.matches('hi s'))
+		self.assertFalse(ahoCorasick.matches(''))
+		self.assertTrue(AhoCorasick([b'abcd', b'bce']).matches(b'xabce'))
+		self.assertFalse(AhoCorasick(['abcd', 'bce']).matches('abcbc'))
+
+	def testBlocklist(self):
+		words = ['w{}x{}'.format(n, n * 7 % 13) for n in range(200)]
+		for mode in pyregex.ENGINES:
+			with self.subTest(mode=mode):
+				matcher = pyregex.compile('|'.join(words), mode)
+				self.assertTrue(matcher.matches('--w150x10--'))
+				self.assertFalse(matcher.matches('--w150x7--'))
+
+class AlphabetTest(unittest.TestCase):
+	def testClasses(self):
+		alphabet = genAlphabet(['a', 'b', '\u4e2d', 'a'])
+		self.assertEqual(alphabet.numClasses, 4)
+		self.assertEqual(alphabet.classOf('z'), 0)
+		self.assertEqual(alphabet.classOf('\u4e2e'), 0)
+		self.assertEqual(len({alphabet.classOf(c) for c in 'ab\u4e2d'}), 3)
+		self.assertEqual(alphabet.classesOf('b'), [alphabet.classOf('b')])
+		self.assertEqual(list(alphabet.translate('xa\u4e2db\u00e9')), [alphabet.classOf(c) for c in 'xa\u4e2db\u00e9'])
+		self.assertEqual(list(alphabet.translate(b'xab')), [0, alphabet.classOf('a'), alphabet.classOf('b')])
+
+	def testManyClasses(self):
+		chars = [chr(0x100 + n) for n in range(300)]
+		regex = '(' + '|'.join(chars) + ')+y'
+		alphabet = genAlphabet(chars)
+		self.assertFalse(alphabet.translatable)
+		for mode in ('dfa', 'bitparallel'):
+			with self.subTest(mode=mode):
+				matcher = pyregex.compile(regex, mode)
+				self.assertTrue(matcher.matches('x' + chars[5] + chars[299] + 'y'))
+				self.assertFalse(matcher.matches('x' + chars[5] + 'zy'))
+
+class CharClassTest(unittest.TestCase):
+	def testMembership(self):
+		charClass = CharClass([(ord('x'), ord('z')), (ord('a'), ord('c')), (ord('b'), ord('d'))])
+		self.assertEqual(charClass.intervals, ((ord('a'), ord('d')), (ord('x'), ord('z'))))
+		self.assertEqual(len(charClass), 7)
+		self.assertIn('c', charClass)
+		self.assertNotIn('e', charClass)
+		self.assertIn('\u4e2d', charRange('\u4e00', '\u9fff'))
+		self.assertNotIn('\u4e2d', charRange('\u4e00', '\u9fff').negated())
+		self.assertNotIn('\n', DOT)
+		self.assertIn('\U0001f600', DOT)
+
+	def testUTF8Sequences(self):
+		charClass = CharClass([(0x61, 0x62), (0xe0, 0x4e2d), (0xd7ff, 0xe000)])
+		for c in list(charClass)[::97] + [0xd7ff, 0xe000]:
+			if 0xd800 <= c <= 0xdfff:
+				continue
+			encoded = chr(c).encode()
+			matching = [sequence for sequence in utf8Sequences(charClass)
+				if len(sequence) == len(encoded) and all(b in byteClass for b, byteClass in zip(encoded, sequence))]
+			self.assertEqual(len(matching), 1)
+		self.assertEqual(utf8Sequences(charRange('\u00e0', '\u00ff')), [(charRange('\xc3', '\xc3'), charRange('\xa0', '\xbf'))])
+
+	def testBadClasses(self):
+		self.assertRaises(EOFError, pyregex.compile, '[ab')
+		self.assertRaises(Exception, pyregex.compile, '[z-a]')
+
+class BenchmarkTest(unittest.TestCase):
+	def testCorporaAreFixed(self):
+		self.assertEqual(genCorpus('logs', 0.01), genCorpus('logs', 0.01))
+
+	def testRunAll(self):
+		results = runAll(['dfa', 'codegen'], ['log-literal', 'dfa-blowup'], scale=0.005, repeat=1)
+		self.assertEqual([(result['benchmark'], result['engine']) for result in results], [
+			('log-literal', 'dfa'), ('log-literal', 'codegen'), ('dfa-blowup', 'dfa'), ('dfa-blowup', 'codegen')])
+		self.assertGreater(results[0]['mbPerSecond'], 0)
+		self.assertIn('error', results[3])
+
+	def testCompareResults(self):
+		old = {'benchmark': 'b', 'engine': 'dfa', 'compileSeconds': 1.0, 'mbPerSecond': 10.0, 'lineLatencyMicros': 1.0}
+		baseline = {'results': [old]}
+		self.assertEqual(compareResults([dict(old, mbPerSecond=9.0)], baseline, 0.2), [])
+		self.assertEqual(len(compareResults([dict(old, mbPerSecond=7.0)], baseline, 0.2)), 1)
+		self.assertEqual(len(compareResults([dict(old, compileSeconds=2.0)], baseline, 0.2)), 1)
+		self.assertEqual(compareResults([dict(old, engine='nfa', mbPerSecond=1.0)], baseline, 0.2), [])
+
+class ProgramTest(unittest.TestCase):
+	def conditions(self, program, states):
+		return sorted(program.conditions[state] for state in states)
+
+	def testClosures(self):
+		program = genProgram('a*b')
+		self.assertEqual(self.conditions(program, program.enterClosure), ['a', 'b'])
+
+	def testAssertions(self):
+		program = genProgram('^a|b$')
+		self.assertEqual(self.conditions(program, program.enterClosure), ['b'])
+		self.assertEqual(self.conditions(program, program.closures[AT_START][program.enter]), ['a', 'b'])
+		bState = program.enterClosure[0]
+		self.assertEqual(self.conditions(program, program.successors[bState]), ['$'])
+		dollar = program.successors[bState][0]
+		self.assertEqual(list(program.closures[AT_END][dollar]), [program.exit])
+
+	def testConditionIds(self):
+		program = genProgram('^a[a-c]$')
+		alphabet = program.alphabet
+		byCondition = {program.conditions[state]: program.conditionIds[state] for state in range(len(program))}
+		self.assertEqual(byCondition['^'], -1)
+		self.assertEqual(byCondition[None], -1)
+		self.assertEqual(alphabet.conditions[byCondition['a']], 'a')
+		self.assertEqual(len(alphabet.classConditions[alphabet.classOf('a')]), 2)
+		self.assertEqual(len(alphabet.classConditions[alphabet.classOf('b')]), 1)
+		self.assertEqual(alphabet.classConditions[alphabet.classOf('z')], frozenset())
+
+
+class SimplifyTest(unittest.TestCase):
+	def shape(self, node):
+		'''
+		The structure of an AST, without its groups.
+		'''
+		if isinstance(node, GroupNode):
+			return self.shape(node.child)
+		if isinstance(node, ConcatNode):
+			return ('cat',) + tuple(map(self.shape, node.children))
+		if isinstance(node, AlternationNode):
+			return ('alt',) + tuple(map(self.shape, node.children))
+		if isinstance(node, DuplicationNode):
+			return (node.op.value, self.shape(node.child))
+		if isinstance(node, RepetitionNode):
+			return ('rep', node.min, node.max, self.shape(node.child))
+		if isinstance(node, AnchorNode):
+			return ('anchor', node.start, node.end, self.shape(node.child))
+		if isinstance(node, CharClassNode):
+			return node.charClass.intervals
+		return node.char.value
+
+	def testSimplify(self):
+		for regex, expected in simplifyTests:
+			with self.subTest(regex=regex):
+				simplified = simplifyAST(Parser(regex).parse())
+				self.assertEqual(self.shape(simplified), self.shape(Parser(expected).parse()))
+
+	def testSmaller(self):
+		words = '|'.join('w{}x{}'.format(n, n * 7) for n in range(100))
+		program = genProgram(words)
+		self.assertEqual(len(program.enterClosure), 1)
+		self.assertTrue(MatchTester(words).matches('--w42x294--'))
+		self.assertFalse(MatchTester(words).matches('--w42x295--'))
+
 
 tests = [
 	('a', 'a', True),
@@ -192,6 +874,98 @@ tests = [
     ('multiple words of text', 'uh-uh', False),
     ('multiple words', 'multiple words, yeah', True),
     (r'^((a)c)?(ab)$', 'ab', True),
+    ('[a-c]x', 'bx', True),
+    ('[a-c]x', 'dx', False),
+    ('^[^a]$', 'a', False),
+    ('^[^a]$', 'b', True),
+    ('[]a]', ']', True),
+    ('[a-]', '-', True),
+    ('^.$', '\n', False),
+    ('a.c', 'abc', True),
+    (r'\d+x', 'a12x', True),
+    (r'\d', 'abc', False),
+    (r'^\w+\s\S$', 'ab_1 x', True),
+    (r'[\]\\]', '\\', True),
+    (r'\.', 'a', False),
+    ('^a{3}$', 'aaa', True),
+    ('^a{3}$', 'aa', False),
+    ('^a{2,3}$', 'aaaa', False),
+    ('^a{2,}$', 'aaaaa', True),
+    ('^a{,2}$', 'aa', True),
+    ('^(ab){1,2}c$', 'ababc', True),
+    ('^(ab){1,2}c$', 'abababc', False),
+    ('x[0-9]{2,4}y', 'x123y', True),
+    ('x[0-9]{2,4}y', 'x1y', False),
+    ('^a{0}b$', 'b', True),
+    ('a{x}', 'a{x}', True),
+    ('a{', 'a{', True),
+    (r'\{1\}', '{1}', True),
 
 ]
 
+
+spanTests = [
+	('abcd|c', 'abcd', [(0, 4)]),
+	('a*', 'baa', [(0, 0), (1, 3), (3, 3)]),
+	('b$', 'abb', [(2, 3)]),
+	('^a', 'aa', [(0, 1)]),
+	('^a*$', 'aaa', [(0, 3)]),
+	('(a|ab)(c|bcd)', 'abcd', [(0, 4)]),
+	('ab+', 'abbxabab', [(0, 3), (4, 6), (6, 8)]),
+	('x', 'abc', []),
+	('', '', [(0, 0)]),
+]
+
+
+simplifyTests = [
+	('(a*)*', 'a*'),
+	('(a?)*', 'a*'),
+	('(a+)?', 'a*'),
+	('(a+)+', 'a+'),
+	('(a?)?', 'a?'),
+	('(ab|cd)|ef', 'ab|cd|ef'),
+	('ab|cd|ab', 'ab|cd'),
+	('abc|abd', 'ab[cd]'),
+	('abc|abe|x', 'ab[ce]|x'),
+	('ab|abc', 'abc?'),
+	('xab|yb', '(xa|y)b'),
+	('foo(bar|baz)|foo', 'foo(ba[rz])?'),
+	('a|b|[x-z]', '[abx-z]'),
+	('car|cat|dog|dig', 'ca[rt]|d[io]g'),
+	('[a-c]|[b-e]', '[a-e]'),
+	('a{0,}', 'a*'),
+	('a{1,}', 'a+'),
+	('a{0,1}b{1}c{0}', 'a?b'),
+	('(ab){2,3}|(ab){2,3}', '(ab){2,3}'),
+	('^a|^b', '^a|^b'),
+]
+
+captureTests = [
+	('a(b)c', 'xabc', [(1, 4), (2, 3)]),
+	('(a|ab)(c|bcd)', 'abcd', [(0, 4), (0, 1), (1, 4)]),
+	('(a*)(a*)', 'aaa', [(0, 3), (0, 3), (3, 3)]),
+	('(a)|(b)', 'xb', [(1, 2), None, (1, 2)]),
+	('(a|b)+', 'abab', [(0, 4), (3, 4)]),
+	('^(ab)?(a)', 'a', [(0, 1), None, (0, 1)]),
+	('(b)$', 'bb', [(1, 2), (1, 2)]),
+	('((a)b)*c', 'ababc', [(0, 5), (2, 4), (2, 3)]),
+	('()x', 'x', [(0, 1), (0, 0)]),
+	('(a)', 'b', None),
+	('(a|b){2,3}', 'xabab', [(1, 4), (3, 4)]),
+	('(a){1,2}(a)', 'aaa', [(0, 3), (1, 2), (2, 3)]),
+]
+
+
+unicodeTests = [
+	('caf\u00e9', 'un caf\u00e9', True),
+	('caf\u00e9', 'cafe', False),
+	('^\u00e9+$', '\u00e9\u00e9', True),
+	('^\u00e9+$', '\u00e9e', False),
+	('(\u00e9|\u00e8)$', 'x\u00e8', True),
+	('\u00e9', '\u00e8', False),
+	('^[\u00e0-\u00ff]+$', '\u00e9\u00e8', True),
+	('^[^\u00e9]$', '\u4e2d', True),
+	('^[^\u00e9]$', '\u00e9', False),
+	('^.x$', '\U0001f600x', True),
+	(r'\w', '\u00e9', False),
+]
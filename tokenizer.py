@@ -1,5 +1,9 @@
+from charclass import CharClass, SHORTHANDS, DOT
+
 CHAR = 'CHAR'
 SPECIAL = 'SPECIAL'
+CLASS = 'CLASS'
+REPEAT = 'REPEAT'
 
 class Token:
 	def __init__(self, type_, value):
@@ -14,18 +18,34 @@ class Token:
 	def isSpecial(self):
 		return self.type == SPECIAL
 
+	def isClass(self):
+		return self.type == CLASS
+
+	def isRepeat(self):
+		return self.type == REPEAT
+
 	def __str__(self):
 		return 'Token({}, {})'.format(self.type, self.value)
 
 
 SPECIALS = {'+','?', '*', '(', ')', '|', '^', '$'}
-ESCAPED_SPECIALS = set(map(lambda c: '\\'+c, SPECIALS))
+ESCAPED_SPECIALS = set(map(lambda c: '\\'+c, SPECIALS | {'.', '[', ']', '{', '}', '\\'}))
 
 
 def tokenizeRegex(regex):
 	tokens = []
 	pos = 0
 	while pos < len(regex):
+		if regex[pos] == '[':
+			charClass, pos = tokenizeBracket(regex, pos + 1)
+			tokens.append(Token(CLASS, charClass))
+			continue
+		if regex[pos] == '{':
+			bounds, end = tokenizeRepeat(regex, pos + 1)
+			if bounds is not None:
+				tokens.append(Token(REPEAT, bounds))
+				pos = end
+				continue
 		if regex[pos] == '\\':
 			if pos+1 >= len(regex):
 				raise EOFError()
@@ -37,8 +57,12 @@ def tokenizeRegex(regex):
 
 		if value in SPECIALS:
 			tokens.append(Token(SPECIAL, value))
+		elif value == '.':
+			tokens.append(Token(CLASS, DOT))
 		elif value in ESCAPED_SPECIALS:
 			tokens.append(Token(CHAR, value[1]))
+		elif len(value) == 2 and value[1] in SHORTHANDS:
+			tokens.append(Token(CLASS, SHORTHANDS[value[1]]))
 		elif len(value) == 1:
 			tokens.append(Token(CHAR, value))
 		else:
@@ -46,6 +70,80 @@ def tokenizeRegex(regex):
 
 	return tokens
 
+
+def tokenizeBracket(regex, pos):
+	'''
+	Reads a bracket expression (e.g. [a-z_] or [^\\s]) starting just after
+	its '[', and returns its CharClass and the position after its ']'. A ']'
+	first in the brackets, or a '-' first or last, is just a character, and
+	inside brackets a backslash escapes anything but a letter or digit.
+	'''
+	negated = regex[pos:pos+1] == '^'
+	if negated:
+		pos += 1
+	intervals = []
+	start = pos
+	while True:
+		if pos >= len(regex):
+			raise EOFError('Unterminated character class')
+		if regex[pos] == ']' and pos > start:
+			pos += 1
+			break
+		first, pos = _bracketChar(regex, pos)
+		if isinstance(first, CharClass):
+			intervals += first.intervals
+			continue
+		if regex[pos:pos+1] == '-' and regex[pos+1:pos+2] not in ('', ']'):
+			last, pos = _bracketChar(regex, pos + 1)
+			if isinstance(last, CharClass) or last < first:
+				raise Exception('Bad character range: "' + regex[start:pos] + '"')
+			intervals.append((first, last))
+		else:
+			intervals.append((first, first))
+
+	charClass = CharClass(intervals)
+	return (charClass.negated() if negated else charClass), pos
+
+
+def tokenizeRepeat(regex, pos):
+	'''
+	Reads a counted repetition ({m}, {m,}, {,n} or {m,n}) starting just after
+	its '{', and returns its (min, max) and the position after its '}'. max is
+	None if there's no upper bound. Like in Python's re, a '{' that doesn't
+	start one of those is just a character, in which case bounds is None.
+	'''
+	end = regex.find('}', pos)
+	if end == -1:
+		return None, pos
+	parts = regex[pos:end].split(',')
+	if len(parts) > 2 or regex[pos:end] == '' or not all(part == '' or (part.isascii() and part.isdigit()) for part in parts):
+		return None, pos
+	low = int(parts[0]) if parts[0] != '' else 0
+	if len(parts) == 1:
+		high = low
+	else:
+		high = int(parts[1]) if parts[1] != '' else None
+	if high is not None and high < low:
+		raise Exception('Bad repetition: "' + regex[pos-1:end+1] + '"')
+	return (low, high), end + 1
+
+
+def _bracketChar(regex, pos):
+	'''
+	Reads one character in a bracket expression, and returns its code point
+	(or its CharClass, for a shorthand like \\d) and the position after it.
+	'''
+	if regex[pos] != '\\':
+		return ord(regex[pos]), pos + 1
+	if pos + 1 >= len(regex):
+		raise EOFError()
+	c = regex[pos + 1]
+	if c in SHORTHANDS:
+		return SHORTHANDS[c], pos + 2
+	if c.isalnum():
+		raise Exception('Unhandled Token: "' + regex[pos:pos+2] + '"')
+	return ord(c), pos + 2
+
 class Tokenizer:
 	def __init__(self, regex):
 		self._tokens = tokenizeRegex(regex)